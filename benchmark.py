@@ -0,0 +1,160 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import time
+from typing import Callable, Dict, List, Tuple, Any
+
+import numpy as np
+
+from extractor import extract
+from metrics import metrics
+from shuffle import Shuffle
+
+# { Dataset: ( [required directory], max identities, max cameras, max images, path of (identity, camera, image) ) }
+LAYOUTS: Dict[str, Tuple[List[str], int, int, int, Callable[[int, int, int], str]]] = {
+    "market1501": (
+        ['bounding_box_train', 'bounding_box_test', 'gt_bbox', 'query'], 9999, 9, 10 ** 6,
+        lambda i, c, k: f'bounding_box_train/{i + 1:04d}_c{c + 1}s1_{k:06d}_00.jpg'
+    ),
+    "msmt17": (
+        ['bounding_box_test', 'query'], 9999, 99, 10 ** 4,
+        lambda i, c, k: f'bounding_box_test/{i + 1:04d}_c{c + 1}_{k:04d}.jpg'
+    ),
+    "duke": (
+        ['bounding_box_train', 'bounding_box_test', 'query'], 9999, 9, 10 ** 6,
+        lambda i, c, k: f'bounding_box_train/{i + 1:04d}_c{c + 1}_f{k:07d}.jpg'
+    ),
+    "personx": (
+        ['bounding_box_train', 'bounding_box_test', 'query'], 9999, 9, 10 ** 6,
+        lambda i, c, k: f'bounding_box_train/{i + 1:04d}_c{c + 1}s1_{k:06d}.jpg'
+    ),
+    "cuhk03": (
+        ['train', 'val'], 10 ** 4, 2, 5,
+        lambda i, c, k: f'train/{i:04d}_{c * 5 + k:02d}.jpg'
+    ),
+    "pku": (
+        [''], 999, 99, 10,
+        lambda i, c, k: f'{i + 1:03d}_{c + 1:02d}_{k}.png'
+    ),
+    "ethz": (
+        ['seq1', 'seq2', 'seq3'], 3 * 99, 1, 10 ** 4,
+        lambda i, c, k: f'seq{i // 99 + 1}/p{i % 99 + 1:03d}/frame{k:04d}Person{i % 99 + 1:02d}.png'
+    ),
+    "prid2011": (
+        ['multi_shot/cam_a', 'multi_shot/cam_b', 'single_shot/cam_a', 'single_shot/cam_b'], 10 ** 4, 2, 10 ** 4,
+        lambda i, c, k: f'multi_shot/cam_{"ab"[c]}/person_{i + 1:04d}/{k:04d}.png'
+    ),
+}
+
+
+def generate_dataset(
+        dataset: str, root: str, identities: int, cameras: int, images: int, file_size: int = 0
+) -> Dict[str, int]:
+    """
+    generate a fake dataset tree in the layout of the dataset extractor, each
+    identity has images in each camera, the counts are clamped to what the
+    naming layout could hold.
+    :return: the generated identity, camera, image of each identity in each
+        camera and total image counts
+    """
+    dirs, max_identities, max_cameras, max_images, path_of = LAYOUTS[dataset]
+    identities, cameras, images = min(identities, max_identities), min(cameras, max_cameras), min(images, max_images)
+    for dir_name in dirs:
+        os.makedirs(os.path.join(root, dir_name), exist_ok=True)
+
+    data = b'\0' * file_size
+    made_dirs = set()
+    for i, c, k in itertools.product(range(identities), range(cameras), range(images)):
+        img_path = os.path.join(root, path_of(i, c, k))
+        img_dir = os.path.dirname(img_path)
+        if img_dir not in made_dirs:
+            os.makedirs(img_dir, exist_ok=True)
+            made_dirs.add(img_dir)
+        with open(img_path, 'wb') as f:
+            f.write(data)
+    return {
+        'identities': identities, 'cameras': cameras, 'images': images, 'image_count': identities * cameras * images
+    }
+
+
+def benchmark_dataset(
+        dataset: str, root: str, output: str, shuffle: Shuffle, seed: int = 0
+) -> Tuple[Dict[str, Dict[str, Any]], int]:
+    """
+    extract a dataset, plan and save its tasks by Shuffle.plan and
+    Shuffle.save_plan, the same as main.py.
+    :return: { stage: record } of the stages in the metrics, and the
+        extracted image count
+    """
+    metrics.reset()
+    datapack = extract([dataset], [root])
+    shuffle.save_plan(shuffle.plan(datapack, seed), output)
+    return metrics.report()['stages'], datapack.img_cnt
+
+
+def _version() -> Dict[str, str]:
+    version = {'python': platform.python_version(), 'numpy': np.__version__}
+    try:
+        version['commit'] = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--datasets', type=str, nargs='+', required=False, default=list(LAYOUTS),
+                        choices=list(LAYOUTS), help='dataset layouts to benchmark')
+    parser.add_argument('--identities', type=int, nargs='+', required=False, default=[1000],
+                        help='identity counts of the fake datasets')
+    parser.add_argument('--cameras', type=int, nargs='+', required=False, default=[6],
+                        help='camera counts of the fake datasets')
+    parser.add_argument('--images', type=int, nargs='+', required=False, default=[4],
+                        help='image counts of each identity in each camera')
+    parser.add_argument('--file_size', type=int, required=False, default=0, help='bytes of each fake image')
+    parser.add_argument('--task_indice', type=int, nargs='+', required=False, default=[5, 10],
+                        help='edge node and task count')
+    parser.add_argument('--output_format', type=str, required=False, default='manifest', help='task output format')
+    parser.add_argument('--workers', type=int, required=False, default=1, help='image copy worker count')
+    parser.add_argument('--work_dir', type=str, required=False, default='./benchmark',
+                        help='directory of the fake datasets and outputs, which are removed after each run')
+    parser.add_argument('--report', type=str, required=False, default='benchmark.json', help='json result path')
+    args = vars(parser.parse_args())
+
+    shuffle = Shuffle(task_indice=args['task_indice'], workers=args['workers'], output_format=args['output_format'])
+    report = {'version': _version(), 'config': args, 'results': []}
+    for dataset, identities, cameras, images in itertools.product(
+            args['datasets'], args['identities'], args['cameras'], args['images']
+    ):
+        root = os.path.join(args['work_dir'], dataset)
+        output = os.path.join(args['work_dir'], 'output')
+        result = {'dataset': dataset, 'identities': identities, 'cameras': cameras, 'images': images}
+        # a failing combination is recorded and the others still run
+        try:
+            start = time.perf_counter()
+            result.update(generate_dataset(dataset, root, identities, cameras, images, args['file_size']))
+            result['generate'] = time.perf_counter() - start
+            result['stages'], result['extracted'] = benchmark_dataset(dataset, root, output, shuffle)
+        except Exception as e:
+            result['error'] = f'{type(e).__name__}: {e}'
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+            shutil.rmtree(output, ignore_errors=True)
+        print(json.dumps(result))
+        report['results'].append(result)
+
+        # the report is written after each result, so an interrupted run
+        # keeps the finished ones
+        with open(args['report'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,357 @@
-from typing import List, Union
+import os
+from array import array
+from typing import Any, List, Union, Dict, Sequence, Iterable, Tuple
+
+import numpy as np
+
+
+class PathTable(object):
+    """
+    PathTable interns the image paths as a table of root directories and
+    the image names relative to their root, which are kept in one
+    contiguous byte buffer with offsets. The full path of an image is only
+    resolved when it is indexed.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.roots = []  # [ Root ]
+        self.root_lut = {}  # { Root: index of Root }
+        self.root_idx = array('I')
+        self.offsets = array('q', [0])
+        self.names = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.root_idx)
+
+    def __getitem__(self, idx: int) -> str:
+        name = self.names[self.offsets[idx]:self.offsets[idx + 1]]
+        return self.roots[self.root_idx[idx]] + os.fsdecode(bytes(name))
+
+    def _root_index(self, root: str) -> int:
+        if root not in self.root_lut:
+            self.root_lut[root] = len(self.roots)
+            self.roots.append(root)
+        return self.root_lut[root]
+
+    def append(self, path: str):
+        self.extend([path])
+
+    def extend(self, paths: Iterable[str]):
+        root_lut, names, offsets = self.root_lut, self.names, self.offsets
+        for path in paths:
+            # the root keeps its trailing separator, so root + name is the path
+            split_idx = path.rfind(os.sep) + 1
+            root = path[:split_idx]
+            root_idx = root_lut.get(root)
+            self.root_idx.append(root_idx if root_idx is not None else self._root_index(root))
+            names += os.fsencode(path[split_idx:])
+            offsets.append(len(names))
+
+    def extend_dirs(self, dirs: Sequence[Tuple[str, Sequence[str]]]):
+        """
+        append the images of names in each directory of [ (dir_path, names) ]
+        at once.
+        """
+        encoded = []
+        for dir_path, names in dirs:
+            root_idx = self._root_index(os.path.join(dir_path, ''))
+            self.root_idx.extend(array('I', [root_idx]) * len(names))
+            encoded.extend(os.fsencode(name) for name in names)
+        names_offset = len(self.names)
+        self.names += b''.join(encoded)
+        self.offsets.extend((names_offset + np.cumsum([len(name) for name in encoded], dtype=np.int64)).tolist())
+
+    def merge(self, other: 'PathTable'):
+        root_remap = array('I', [self._root_index(root) for root in other.roots])
+        self.root_idx.extend(root_remap[idx] for idx in other.root_idx)
+        names_offset = len(self.names)
+        self.offsets.extend(offset + names_offset for offset in other.offsets[1:])
+        self.names += other.names
 
 
 class DataPack(object):
+    """
+    DataPack keeps the images as columnar rows, each row is an image with
+    its camera id, person id and the index of its path in the path table.
+    The rows are grouped by camera in the order of cameras, and the rows of
+    one camera are grouped by person in the order they were added, so that
+    relabeling, merging or splitting cameras and reordering persons are
+    array permutations. The nested dict view { Camera: { Person: [Image] } }
+    is still available as pack, where Image is the index of the image path
+    in paths, and the path is resolved by paths[Image] when it is needed.
+    """
+
     def __init__(self) -> None:
         super().__init__()
         self.current_person = -1
         self.current_camera = -1
         self.img_cnt = 0
-        self.pack = {}  # { Camera: { Person: [Image] } }
+        self.cameras = np.empty(0, dtype=np.int64)
+        self.persons = np.empty(0, dtype=np.int64)
+        self.images = np.empty(0, dtype=np.int64)
+        self.paths = PathTable()
+        self.camera_seq = []  # [ Camera ]
+        self.sources = []  # [ (dataset, root) ] the images were extracted from
+        self._pending = ([], [], [])  # ( [Camera], [Person], [Image index] )
+        self._offsets = None
+        self._pack = None
+
+    def _changed(self):
+        self._offsets = None
+        self._pack = None
 
     def register_camera(self) -> int:
         self.current_camera += 1
-        self.pack[self.current_camera] = {}
+        self.camera_seq.append(self.current_camera)
+        self._changed()
         return self.current_camera
 
     def register_person(self) -> int:
         self.current_person += 1
         return self.current_person
 
+    def register_cameras(self, count: int) -> np.ndarray:
+        camera_ids = np.arange(self.current_camera + 1, self.current_camera + 1 + count)
+        self.current_camera += int(count)
+        self.camera_seq.extend(camera_ids.tolist())
+        self._changed()
+        return camera_ids
+
+    def register_persons(self, count: int) -> np.ndarray:
+        person_ids = np.arange(self.current_person + 1, self.current_person + 1 + count)
+        self.current_person += int(count)
+        return person_ids
+
     def add_image_path(self, person_id: int, camera_id: int, image_paths: Union[List[str], str]):
         if isinstance(image_paths, str):
             image_paths = [image_paths]
+        if camera_id not in self.camera_seq:
+            raise KeyError(camera_id)
+        path_idx = len(self.paths)
+        self.paths.extend(image_paths)
         self.img_cnt += len(image_paths)
-        if person_id not in self.pack[camera_id].keys():
-            self.pack[camera_id][person_id] = []
-        self.pack[camera_id][person_id].extend(image_paths)
+        self._pending[0].extend([camera_id] * len(image_paths))
+        self._pending[1].extend([person_id] * len(image_paths))
+        self._pending[2].extend(range(path_idx, len(self.paths)))
+        self._changed()
+
+    def add_images(self, person_ids: np.ndarray, camera_ids: np.ndarray, image_paths: Iterable[str]):
+        """
+        add the images of person_ids[i] in camera_ids[i] at once, in the
+        same order as adding them one by one by add_image_path.
+        """
+        person_ids, camera_ids = self._check_ids(person_ids, camera_ids)
+        path_idx = len(self.paths)
+        self.paths.extend(image_paths)
+        if len(self.paths) - path_idx != len(person_ids):
+            raise ValueError("The count of image paths differs from that of person and camera ids.")
+        self._add_rows(person_ids, camera_ids, path_idx)
+
+    def add_dir_images(
+            self, person_ids: np.ndarray, camera_ids: np.ndarray, dirs: Sequence[Tuple[str, Sequence[str]]]
+    ):
+        """
+        add the images of names in each directory of [ (dir_path, names) ]
+        at once, like add_images.
+        """
+        person_ids, camera_ids = self._check_ids(person_ids, camera_ids)
+        if sum(len(names) for _, names in dirs) != len(person_ids):
+            raise ValueError("The count of image names differs from that of person and camera ids.")
+        path_idx = len(self.paths)
+        self.paths.extend_dirs(dirs)
+        self._add_rows(person_ids, camera_ids, path_idx)
+
+    def _check_ids(self, person_ids: np.ndarray, camera_ids: np.ndarray) -> Sequence[np.ndarray]:
+        person_ids = np.asarray(person_ids, dtype=np.int64)
+        camera_ids = np.asarray(camera_ids, dtype=np.int64)
+        if len(person_ids) != len(camera_ids):
+            raise ValueError("The count of person ids differs from that of camera ids.")
+        missing = np.setdiff1d(camera_ids, self.camera_seq)
+        if len(missing):
+            raise KeyError(int(missing[0]))
+        return person_ids, camera_ids
+
+    def _add_rows(self, person_ids: np.ndarray, camera_ids: np.ndarray, path_idx: int):
+        self.img_cnt += len(person_ids)
+        self._pending[0].extend(camera_ids.tolist())
+        self._pending[1].extend(person_ids.tolist())
+        self._pending[2].extend(range(path_idx, path_idx + len(person_ids)))
+        self._changed()
+
+    def fingerprint(self) -> Dict[str, Any]:
+        """
+        the datasets and roots the images were extracted from, and the image,
+        person and camera counts, which identify the input of a run.
+        """
+        return {
+            'datasets': [dataset for dataset, _ in self.sources],
+            'roots': [root for _, root in self.sources],
+            'images': self.img_cnt,
+            'persons': self.current_person + 1,
+            'cameras': self.current_camera + 1,
+        }
+
+    def copy(self) -> 'DataPack':
+        """
+        copy the rows and the cameras of the datapack, the path table is
+        shared since it is only appended by adding images.
+        """
+        self._flush()
+        datapack = DataPack()
+        datapack.current_person = self.current_person
+        datapack.current_camera = self.current_camera
+        datapack.img_cnt = self.img_cnt
+        datapack.cameras = self.cameras.copy()
+        datapack.persons = self.persons.copy()
+        datapack.images = self.images.copy()
+        datapack.paths = self.paths
+        datapack.camera_seq = list(self.camera_seq)
+        datapack.sources = list(self.sources)
+        return datapack
+
+    def merge(self, other: 'DataPack'):
+        """
+        append the cameras, persons and images of other datapack, which get
+        the same ids as if they were registered in this datapack after the
+        current ones.
+        """
+        self._flush()
+        other._flush()
+        camera_offset = self.current_camera + 1
+        person_offset = self.current_person + 1
+        self.cameras = np.concatenate([self.cameras, other.cameras + camera_offset])
+        self.persons = np.concatenate([self.persons, other.persons + person_offset])
+        self.images = np.concatenate([self.images, other.images + len(self.paths)])
+        self.paths.merge(other.paths)
+        self.camera_seq.extend(camera_id + camera_offset for camera_id in other.camera_seq)
+        self.sources.extend(other.sources)
+        self.current_camera += other.current_camera + 1
+        self.current_person += other.current_person + 1
+        self.img_cnt += other.img_cnt
+        self._changed()
+
+    def _flush(self):
+        if not len(self._pending[0]):
+            return
+        self.cameras = np.concatenate([self.cameras, np.array(self._pending[0], dtype=np.int64)])
+        self.persons = np.concatenate([self.persons, np.array(self._pending[1], dtype=np.int64)])
+        self.images = np.concatenate([self.images, np.array(self._pending[2], dtype=np.int64)])
+        self._pending = ([], [], [])
+        self._group()
+
+    def _take(self, order: np.ndarray, rows: slice = slice(None)):
+        self.cameras[rows] = self.cameras[rows][order]
+        self.persons[rows] = self.persons[rows][order]
+        self.images[rows] = self.images[rows][order]
+        self._changed()
+
+    def _camera_rank(self) -> np.ndarray:
+        rank = np.full(max(self.camera_seq, default=-1) + 1, -1, dtype=np.int64)
+        rank[self.camera_seq] = np.arange(len(self.camera_seq))
+        return rank[self.cameras]
+
+    def _group(self):
+        # sort the rows by camera order, then by the first row of each
+        # (camera, person) group, the sort is stable to keep image order.
+        if not len(self.cameras):
+            return
+        pair_key = self.cameras * (self.persons.max() + 1) + self.persons
+        _, first_row, inverse = np.unique(pair_key, return_index=True, return_inverse=True)
+        self._take(np.lexsort((first_row[inverse.ravel()], self._camera_rank())))
+
+    def camera_offsets(self) -> np.ndarray:
+        """
+        row offsets of cameras in camera_seq, rows of camera_seq[i] are in
+        [offsets[i], offsets[i + 1]).
+        """
+        self._flush()
+        if self._offsets is None:
+            counts = np.bincount(self._camera_rank(), minlength=len(self.camera_seq))
+            self._offsets = np.concatenate([[0], np.cumsum(counts)])
+        return self._offsets
+
+    def _camera_rows(self, camera_id: int) -> slice:
+        offsets = self.camera_offsets()
+        rank = self.camera_seq.index(camera_id)
+        return slice(offsets[rank], offsets[rank + 1])
+
+    def camera_persons(self, camera_id: int) -> np.ndarray:
+        rows = self._camera_rows(camera_id)
+        persons = self.persons[rows]
+        if not len(persons):
+            return persons
+        return persons[np.concatenate([[True], persons[1:] != persons[:-1]])]
+
+    def relabel_persons(self, id_lut: Sequence[int]):
+        self._flush()
+        self.persons = np.asarray(id_lut, dtype=np.int64)[self.persons]
+        self._changed()
+
+    def regroup(self, plan: Dict[int, Dict[int, List[int]]]):
+        """
+        regroup all the images to the cameras of plan at once, plan should
+        like:
+        { Camera: { Person: [Source Camera] } }
+        the cameras and the persons of each camera are in the new order, and
+        the images of a person are taken from its source cameras in order.
+        """
+        self._flush()
+        person_num = self.persons.max(initial=-1) + 1
+        plan_keys, plan_values = [], []
+        for cam_rank, (camera_id, person_seq) in enumerate(plan.items()):
+            for person_rank, (person_id, source_cams) in enumerate(person_seq.items()):
+                for source_rank, source_cam in enumerate(source_cams):
+                    plan_keys.append(source_cam * person_num + person_id)
+                    plan_values.append((camera_id, cam_rank, person_rank, source_rank))
+        plan_keys = np.array(plan_keys, dtype=np.int64)
+        plan_values = np.array(plan_values, dtype=np.int64).reshape(-1, 4)
+
+        # look up the new camera and the ranks of each row
+        sorter = np.argsort(plan_keys)
+        row_values = plan_values[sorter[np.searchsorted(plan_keys, self.cameras * person_num + self.persons,
+                                                        sorter=sorter)]]
+        order = np.lexsort((row_values[:, 3], row_values[:, 2], row_values[:, 1]))
+        self.cameras = row_values[order, 0]
+        self.persons = self.persons[order]
+        self.images = self.images[order]
+
+        self.camera_seq = list(plan.keys())
+        self.current_camera = max(self.current_camera, max(self.camera_seq, default=-1))
+        self._changed()
+
+    def reorder_persons(self, camera_id: int, person_ids: Sequence[int]):
+        rows = self._camera_rows(camera_id)
+        persons = self.persons[rows]
+        person_ids = np.asarray(person_ids, dtype=np.int64)
+        order = np.argsort(person_ids, kind='stable')
+        person_rank = order[np.searchsorted(person_ids, persons, sorter=order)]
+        self._take(np.argsort(person_rank, kind='stable'), rows)
+
+    def rebase_cameras(self):
+        """
+        renumber the cameras by their order and sort the persons of each
+        camera by person id.
+        """
+        self._flush()
+        self.cameras = self._camera_rank()
+        self._take(np.lexsort((self.persons, self.cameras)))
+        self.camera_seq = list(range(len(self.camera_seq)))
+        self.current_camera = len(self.camera_seq) - 1
+
+    @property
+    def pack(self) -> Dict[int, Dict[int, List[int]]]:
+        if self._pack is None:
+            self._flush()
+            self._pack = {}
+            offsets = self.camera_offsets()
+            for rank, camera_id in enumerate(self.camera_seq):
+                persons = self.persons[offsets[rank]:offsets[rank + 1]]
+                images = self.images[offsets[rank]:offsets[rank + 1]]
+                bounds = np.flatnonzero(persons[1:] != persons[:-1]) + 1
+                bounds = np.concatenate([[0], bounds, [len(persons)]]) if len(persons) else []
+                person_seq = {}
+                for begin, end in zip(bounds[:-1], bounds[1:]):
+                    person_seq[int(persons[begin])] = images[begin:end].tolist()
+                self._pack[camera_id] = person_seq
+        return self._pack
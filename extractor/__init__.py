@@ -1,12 +1,54 @@
-from extractor import ethz, prid2011, market1501, pku, msmt17, duke, cuhk03, personx
-
-dataset_name = {
-    "ethz": ethz.Extractor,
-    "prid2011": prid2011.Extractor,
-    "market1501": market1501.Extractor,
-    "pku": pku.Extractor,
-    "msmt17": msmt17.Extractor,
-    "duke": duke.Extractor,
-    "cuhk03": cuhk03.Extractor,
-    "personx": personx.Extractor,
-}
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, TYPE_CHECKING
+
+from metrics import metrics
+from registry import EXTRACTOR_GROUP, LazyRegistry
+from extractor.cache import ScanCache
+
+if TYPE_CHECKING:
+    from datapack import DataPack
+
+# an extractor module is only imported when its dataset is first looked up
+dataset_name = LazyRegistry({
+    "ethz": "extractor.ethz:Extractor",
+    "prid2011": "extractor.prid2011:Extractor",
+    "market1501": "extractor.market1501:Extractor",
+    "pku": "extractor.pku:Extractor",
+    "msmt17": "extractor.msmt17:Extractor",
+    "duke": "extractor.duke:Extractor",
+    "cuhk03": "extractor.cuhk03:Extractor",
+    "personx": "extractor.personx:Extractor",
+}, group=EXTRACTOR_GROUP)
+
+
+def extract(
+        datasets: List[str], roots: List[str], workers: Optional[int] = None, scan_cache: Optional[str] = None
+) -> 'DataPack':
+    """
+    extract the datasets concurrently, each dataset into its own datapack,
+    then merge the datapacks in the given order, so that the camera and
+    person ids are the same as extracting the datasets one by one.
+    :param scan_cache: path of the cache file keeping the directory listings
+        between runs, only the directories changed since then are scanned.
+    """
+    from datapack import DataPack
+
+    cache = ScanCache(scan_cache) if scan_cache is not None else None
+
+    def _extract(dataset: str, root: str) -> DataPack:
+        datapack = DataPack()
+        datapack.sources.append((dataset, os.path.abspath(root)))
+        with metrics.stage(f'extract.{dataset}'):
+            dataset_name[dataset](datapack, root, scan_cache=cache).process()
+        return datapack
+
+    datapack = DataPack()
+    try:
+        with metrics.stage('extract'), ThreadPoolExecutor(workers or max(len(datasets), 1)) as executor:
+            for _datapack in executor.map(_extract, datasets, roots):
+                datapack.merge(_datapack)
+    finally:
+        if cache is not None:
+            cache.save()
+    return datapack
@@ -0,0 +1,53 @@
+import os
+import pickle
+import threading
+from typing import List, Optional, Tuple
+
+
+class ScanCache(object):
+    """
+    ScanCache keeps the listing of each scanned directory on disk, keyed by
+    the directory path, an entry is only valid while the modification time
+    of its directory is unchanged, e.g. no file has been added, removed or
+    renamed in it.
+    cache file should like:
+    (version, { dir_path: (mtime_ns, [ (name, is_dir) ]) })
+    and a cache file of another version is discarded.
+    """
+
+    version = 2
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self.entries = {}
+        self.changed = False
+        self.lock = threading.Lock()
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            if isinstance(cached, tuple) and cached[0] == self.version:
+                self.entries = cached[1]
+
+    def get(self, dir_path: str, mtime: int) -> Optional[List[Tuple[str, bool]]]:
+        entry = self.entries.get(os.path.abspath(dir_path))
+        if entry is None or entry[0] != mtime:
+            return None
+        return entry[1]
+
+    def put(self, dir_path: str, mtime: int, listing: List[Tuple[str, bool]]):
+        with self.lock:
+            self.entries[os.path.abspath(dir_path)] = (mtime, listing)
+            self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_path))
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file first, so an interrupted save keeps the
+        # previous cache file.
+        tmp_path = f'{self.cache_path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((self.version, self.entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.cache_path)
+        self.changed = False
@@ -1,10 +1,211 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple, Pattern, Optional, Sequence
+
+import numpy as np
+from tqdm import tqdm
+
 from datapack import DataPack
+from extractor.cache import ScanCache
+from metrics import metrics
+
+
+def as_int(values: np.ndarray) -> np.ndarray:
+    return values.astype(np.int64)
+
+
+class Source(object):
+    """
+    A directory of the dataset relative to its root, the files in it are
+    matched by pattern, or by the pattern of the extractor if it is None.
+    :param subdirs: the files are in the sub directories of the directory,
+        and the name of the sub directory of a file is given as this field.
+    :param fields: constant fields of all the files, e.g. camera='cam_a'.
+    """
+
+    def __init__(self, path: str, pattern: Optional[Pattern] = None, subdirs: Optional[str] = None, **fields: str):
+        self.path = path
+        self.pattern = pattern
+        self.subdirs = subdirs
+        self.fields = fields
 
 
 class ExtractorModule(object):
+    """
+    ExtractorModule extracts a dataset by the declarative spec of its
+    subclass:
+    name       : name of the dataset in messages;
+    pattern    : compiled pattern of the file names, the fields of a file
+                 are the named groups of pattern;
+    sources    : [ Source ] scanned in order;
+    converters : { field: function of the field values }, e.g. as_int;
+    camera     : the fields identifying a camera;
+    person     : the fields identifying a person, the field 'source' is the
+                 index of the source of a file;
+    keep       : function of the fields giving whether each file is kept.
+    The listing of each directory is matched at once, and the cameras and
+    persons are registered in the order they first appear.
+    """
+
+    scan_workers = 8
+
+    name = ''
+    pattern: Optional[Pattern] = None
+    sources: Sequence[Source] = ()
+    converters: Dict[str, Callable[[np.ndarray], np.ndarray]] = {}
+    camera: Tuple[str, ...] = ('camera',)
+    person: Tuple[str, ...] = ('id',)
+    keep: Optional[Callable[[Dict[str, np.ndarray]], np.ndarray]] = None
 
-    def __init__(self, datapack: DataPack, root: str, download: bool = False, **kwargs):
-        pass
+    def __init__(
+            self, datapack: DataPack, root: str, download: bool = False,
+            scan_cache: Optional[ScanCache] = None, **kwargs
+    ):
+        self.datapack = datapack
+        self.root = root
+        self.scan_cache = scan_cache
 
     def process(self, **kwargs):
-        raise NotImplementedError
+        if not os.path.exists(self.root):
+            raise ValueError(f"{self.name} dataset path '{self.root}' could not be found.")
+
+        chunks = []  # [ (dir_path, [name], { field: values }) ]
+        for source_idx, source in enumerate(self.sources):
+            chunks.extend(self._parse_source(source_idx, source))
+        if not len(chunks):
+            return
+
+        # the fields shared by all the sources
+        field_names = set.intersection(*(set(fields.keys()) for _, _, fields in chunks))
+        fields = {field: np.concatenate([chunk[2][field] for chunk in chunks]) for field in field_names}
+        for field, converter in self.converters.items():
+            if field in fields:
+                fields[field] = converter(fields[field])
+        is_kept = self.keep(fields) if self.keep is not None else np.ones(len(fields['source']), dtype=bool)
+
+        # register the cameras and persons in the order they first appear
+        kept_cnt = int(is_kept.sum())
+        camera_codes = self._first_codes([fields[field][is_kept] for field in self.camera], kept_cnt)
+        person_codes = self._first_codes([fields[field][is_kept] for field in self.person], kept_cnt)
+        camera_ids = self.datapack.register_cameras(camera_codes.max(initial=-1) + 1)[camera_codes]
+        person_ids = self.datapack.register_persons(person_codes.max(initial=-1) + 1)[person_codes]
+
+        # save images in datapack
+        dirs, offset = [], 0
+        for dir_path, names, _ in chunks:
+            chunk_kept = is_kept[offset:offset + len(names)].tolist()
+            dirs.append((dir_path, [name for name, kept in zip(names, chunk_kept) if kept]))
+            offset += len(names)
+        self.datapack.add_dir_images(person_ids, camera_ids, dirs)
+
+    @staticmethod
+    def _first_codes(columns: List[np.ndarray], count: int) -> np.ndarray:
+        # code of the key of each row made of columns, the codes are given
+        # in the order that the keys first appear.
+        keys = np.zeros(count, dtype=np.int64)
+        if not count:
+            return keys
+        for column in columns:
+            _, inverse = np.unique(column, return_inverse=True)
+            inverse = inverse.ravel()
+            keys = keys * (inverse.max() + 1) + inverse
+        _, first_row, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        first_rank = np.empty(len(first_row), dtype=np.int64)
+        first_rank[np.argsort(first_row)] = np.arange(len(first_row))
+        return first_rank[inverse.ravel()]
+
+    def _parse_source(self, source_idx: int, source: Source) -> List[Tuple[str, List[str], Dict[str, np.ndarray]]]:
+        dir_path = os.path.join(self.root, source.path)
+        desc = ' '.join(part for part in (self.name, source.path, 'search') if part)
+        if source.subdirs is None:
+            listings = [(dir_path, None, self._list_dir(dir_path, desc))]
+        else:
+            listings = [
+                (os.path.join(dir_path, sub_dir), sub_dir, listing)
+                for sub_dir, listing in self._list_subdirs(dir_path, desc)
+            ]
+
+        chunks = []
+        line_pattern = self._line_pattern(source.pattern or self.pattern)
+        for listing_path, sub_dir, listing in listings:
+            names, fields = self.match(line_pattern, [name for name, is_dir in listing if not is_dir])
+            if not len(names):
+                continue
+            fields['source'] = np.full(len(names), source_idx)
+            for field, value in source.fields.items():
+                fields[field] = np.full(len(names), value)
+            if sub_dir is not None:
+                fields[source.subdirs] = np.full(len(names), sub_dir)
+            chunks.append((listing_path, names, fields))
+        return chunks
+
+    @staticmethod
+    def _line_pattern(pattern: Pattern) -> Pattern:
+        # match the pattern at the start of each line, the first group is
+        # the whole line.
+        return re.compile(rf'^((?:{pattern.pattern})[^\n]*)', pattern.flags | re.MULTILINE)
+
+    @staticmethod
+    def match(line_pattern: Pattern, names: List[str]) -> Tuple[List[str], Dict[str, np.ndarray]]:
+        """
+        match the file names at once by the line pattern of _line_pattern.
+        :return: the matched names and { field: values } of the named groups
+        """
+        # a name of several lines could not be matched as a line
+        matches = line_pattern.findall('\n'.join(name for name in names if '\n' not in name))
+        if line_pattern.groups == 1:
+            matches = [(match,) for match in matches]
+        columns = list(zip(*matches)) if len(matches) else [()] * line_pattern.groups
+        fields = {field: np.array(columns[group - 1], dtype=str) for field, group in line_pattern.groupindex.items()}
+        return list(columns[0]), fields
+
+    def _cached(self, dir_path: str) -> Tuple[Optional[List[Tuple[str, bool]]], Optional[int]]:
+        if self.scan_cache is None:
+            return None, None
+        mtime = os.stat(dir_path).st_mtime_ns
+        listing = self.scan_cache.get(dir_path, mtime)
+        if listing is not None:
+            metrics.count('dirs_cached')
+        return listing, mtime
+
+    def _scan(self, dir_path: str, mtime: Optional[int] = None, desc: Optional[str] = None) -> List[Tuple[str, bool]]:
+        with os.scandir(dir_path) as entries:
+            listing = [(entry.name, entry.is_dir()) for entry in tqdm(entries, desc=desc, disable=desc is None)]
+        metrics.count('files_scanned', len(listing))
+        if self.scan_cache is not None:
+            self.scan_cache.put(dir_path, mtime, listing)
+        return listing
+
+    def _list_dir(self, dir_path: str, desc: Optional[str] = None) -> List[Tuple[str, bool]]:
+        """
+        :return: [ (name, is_dir) ] of the entries of dir_path in directory
+            order, which is only scanned if it changed since it was cached.
+        """
+        listing, mtime = self._cached(dir_path)
+        if listing is None:
+            listing = self._scan(dir_path, mtime, desc)
+        return listing
+
+    def _list_subdirs(self, dir_path: str, desc: Optional[str] = None) -> List[Tuple[str, List[Tuple[str, bool]]]]:
+        """
+        list each sub directory of dir_path, the sub directories are scanned
+        concurrently and only the ones changed since they were cached are
+        scanned again.
+        :return: [ (sub_dir_name, [ (name, is_dir) ]) ] in directory order
+        """
+        sub_dirs = [name for name, is_dir in self._list_dir(dir_path) if is_dir]
+        sub_paths = [os.path.join(dir_path, sub_dir) for sub_dir in sub_dirs]
+        cached = [self._cached(sub_path) for sub_path in sub_paths]
+        listings = [listing for listing, _ in cached]
+        mtimes = [mtime for _, mtime in cached]
+
+        missing = [idx for idx, listing in enumerate(listings) if listing is None]
+        if len(missing):
+            with ThreadPoolExecutor(self.scan_workers) as executor:
+                scanned = executor.map(
+                    self._scan, [sub_paths[idx] for idx in missing], [mtimes[idx] for idx in missing]
+                )
+                for idx, listing in zip(missing, tqdm(scanned, total=len(missing), desc=desc)):
+                    listings[idx] = listing
+        return list(zip(sub_dirs, listings))
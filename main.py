@@ -1,13 +1,31 @@
 import argparse
+from typing import Dict, Any
 
-from datapack import DataPack
 from extractor import dataset_name
-from shuffle import Shuffle
+from metrics import metrics
+from registry import MATERIALIZE_MODES, STORE_KEYS, output_writer
 
 
-def main():
+class ListDatasets(argparse.Action):
+    """
+    print the name and the extractor of each dataset, including the ones of
+    entry points, without importing the extractors, then exit.
+    """
+
+    def __init__(self, option_strings, dest, **kwargs):
+        super(ListDatasets, self).__init__(option_strings, dest, nargs=0, default=argparse.SUPPRESS, **kwargs)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        for name in dataset_name:
+            print(f'{name:<16}{dataset_name.target(name)}')
+        parser.exit()
+
+
+def get_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument('--datasets', type=str, nargs='+', required=True, help='dataset names')
+    parser.add_argument('--list_datasets', action=ListDatasets, help='list the dataset names and exit')
+    parser.add_argument('--datasets', type=str, nargs='+', required=True,
+                        help=f'dataset names, one of {", ".join(dataset_name.targets)} or an installed extractor')
     parser.add_argument('--roots', type=str, nargs='+', required=True, help='dataset root path')
     parser.add_argument('--output', type=str, required=True, help='dataset processed output path')
     parser.add_argument('--split_indice', type=float, nargs='+', required=False, default=[0.8, 0.1, 0.7],
@@ -17,7 +35,50 @@ def main():
     parser.add_argument('--temporal_indice', type=float, nargs='+', required=False, default=[0.5, 3.0],
                         help='temporal ratio and temporal distance indice')
     parser.add_argument('--random_seed', type=int, required=False, default=0, help='split seed')
+    parser.add_argument('--workers', type=int, required=False, default=1, help='image copy worker count')
+    parser.add_argument('--materialize', type=str, required=False, default='copy', choices=MATERIALIZE_MODES,
+                        help='how images are placed in the output')
+    parser.add_argument('--output_format', type=str, required=False, default='tree',
+                        help=f'task output format, one of {", ".join(output_writer.targets)} or an installed writer, '
+                             f'manifest writes split indexes without copying images')
+    parser.add_argument('--shard_size', type=int, required=False, default=256, help='tar shard size in MB')
+    parser.add_argument('--store', type=str, required=False, default=None,
+                        help='object store directory of the store output format, {output}/objects by default')
+    parser.add_argument('--store_key', type=str, required=False, default='path', choices=STORE_KEYS,
+                        help='key of the stored images, content also shares identical images of different paths')
+    parser.add_argument('--image_size', type=int, nargs=2, required=False, default=[256, 128],
+                        help='height and width of the images decoded by the array output format')
+    parser.add_argument('--scan_cache', type=str, required=False, default=None,
+                        help='cache file of dataset directory listings, only changed directories are rescanned')
+    parser.add_argument('--resume', action='store_true', help='resume an interrupted run of the same config')
+    parser.add_argument('--report', type=str, required=False, default=None,
+                        help='json report of the time, memory and io of each stage and task')
+    return parser
+
+
+def check_args(parser: argparse.ArgumentParser, args: Dict[str, Any]):
+    """
+    check the names looked up in the registries, which are not given as
+    choices so that the extractors and writers installed by entry points
+    are only discovered when a name is not built-in.
+    """
+    for dataset in args['datasets']:
+        if dataset not in dataset_name:
+            parser.error(f"unknown dataset '{dataset}', see --list_datasets")
+    if len(args['roots']) != len(args['datasets']):
+        parser.error('--roots should give one root path of each dataset')
+    if args['output_format'] not in output_writer:
+        parser.error(f"unknown output format '{args['output_format']}'")
+
+
+def main():
+    parser = get_parser()
     args = vars(parser.parse_args())
+    check_args(parser, args)
+
+    # imported after the arguments are checked, which does not need numpy
+    from extractor import extract
+    from shuffle import Shuffle
 
     datasets = args['datasets']
     roots = args['roots']
@@ -26,13 +87,28 @@ def main():
     task_indice = args['task_indice']
     temporal_indice = args['temporal_indice']
     random_seed = args['random_seed']
+    workers = args['workers']
+    materialize = args['materialize']
+    output_format = args['output_format']
+    shard_size = args['shard_size']
+    store = args['store']
+    store_key = args['store_key']
+    image_size = args['image_size']
+    scan_cache = args['scan_cache']
+    resume = args['resume']
+    report = args['report']
+
+    if report is not None:
+        metrics.trace_memory()
+    datapack = extract(datasets, roots, scan_cache=scan_cache)
 
-    datapack = DataPack()
-    for dataset, root in zip(datasets, roots):
-        dataset_name[dataset](datapack, root).process()
+    shuffle = Shuffle(split_indice, task_indice, temporal_indice, workers, materialize, output_format,
+                      shard_size=shard_size * 2 ** 20, store=store, store_key=store_key,
+                      image_size=image_size)
+    shuffle.shuffle_and_save(datapack, output, random_seed, resume)
 
-    shuffle = Shuffle(split_indice, task_indice, temporal_indice)
-    shuffle.shuffle_and_save(datapack, output, random_seed)
+    if report is not None:
+        metrics.save(report)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,175 @@
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss() -> int:
+    """
+    peak resident memory of the process in bytes since it started, 0 if it
+    is unknown.
+    """
+    if resource is None:
+        return 0
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Metrics(object):
+    """
+    Metrics records the wall time, the peak memory and the counters of the
+    stages, and the files and bytes written by each task. The peak memory
+    of a stage or a task is the peak of the memory traced by tracemalloc
+    during it, which is only recorded after trace_memory, the report gives
+    the peak resident memory of the whole process. A hook subscribed
+    is called with ('stage', record) when a stage ends and ('task', record)
+    when a task is saved. The counters of the pipeline are:
+    files_scanned : directory entries scanned by the extractors;
+    dirs_cached   : directory listings served from the scan cache;
+    files_written : files written by the output writer;
+    bytes_written : bytes written by the output writer.
+    """
+
+    def __init__(self):
+        self.stages = {}  # { Stage: record }
+        self.stage_totals = {}  # { Stage: (runs, seconds, peak memory, counters) }
+        self.tasks = []  # [ record ]
+        self.counters = {}  # { Counter: value }
+        self.hooks = []  # [ Hook ]
+        self.memory_peaks = {}  # { Block: peak traced memory of the open block }
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def trace_memory():
+        """
+        trace the memory allocated by python and numpy, so that the peak
+        memory of each stage and task is recorded, which slows the
+        allocations down.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _fold_peak(self):
+        # the peak since the last fold is the peak of all the open blocks
+        peak = tracemalloc.get_traced_memory()[1]
+        for block, block_peak in self.memory_peaks.items():
+            self.memory_peaks[block] = max(block_peak, peak)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def peak_memory(self) -> Iterator[Dict[str, int]]:
+        """
+        measure the peak traced memory in the with block, the yielded dict
+        is given the 'peak_memory' in bytes when the block ends, unless the
+        memory is not traced. The blocks could be nested, and the blocks run
+        concurrently are given the peak of the process while they overlap.
+        """
+        record = {}
+        if not tracemalloc.is_tracing():
+            yield record
+            return
+        block = object()
+        with self.lock:
+            self._fold_peak()
+            self.memory_peaks[block] = tracemalloc.get_traced_memory()[0]
+        try:
+            yield record
+        finally:
+            with self.lock:
+                self._fold_peak()
+                record['peak_memory'] = self.memory_peaks.pop(block)
+
+    def subscribe(self, hook: Callable[[str, Dict[str, Any]], None]):
+        self.hooks.append(hook)
+
+    def unsubscribe(self, hook: Callable[[str, Dict[str, Any]], None]):
+        self.hooks.remove(hook)
+
+    def _emit(self, event: str, record: Dict[str, Any]):
+        for hook in self.hooks:
+            hook(event, record)
+
+    def count(self, counter: str, value: int = 1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    @staticmethod
+    def _rates(record: Dict[str, Any], counters: Dict[str, int]):
+        for counter, value in counters.items():
+            record[counter] = value
+            if record['seconds'] > 0:
+                record[f'{counter}_per_second'] = value / record['seconds']
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        record the stage run in the with block, the counters of the stage
+        are the changes of the counters during it, so the stages run
+        concurrently should be given different names and are counted
+        together. A stage run several times, e.g. a dataset extracted from
+        two roots, is reported with the sum of the seconds and counters of
+        its runs, the peak memory of all of them and its run count, while
+        the hooks are called with the record of each run.
+        """
+        with self.lock:
+            start_counters = dict(self.counters)
+        start = time.perf_counter()
+        try:
+            with self.peak_memory() as memory:
+                yield
+        finally:
+            record = {'stage': name, 'seconds': time.perf_counter() - start, **memory}
+            with self.lock:
+                counters = {
+                    counter: value - start_counters.get(counter, 0) for counter, value in self.counters.items()
+                    if value != start_counters.get(counter, 0)
+                }
+                self._rates(record, counters)
+                runs, seconds, memory, total_counters = self.stage_totals.get(name, (0, 0.0, {}, {}))
+                for counter, value in counters.items():
+                    total_counters[counter] = total_counters.get(counter, 0) + value
+                if 'peak_memory' in memory or 'peak_memory' in record:
+                    memory = {'peak_memory': max(memory.get('peak_memory', 0), record.get('peak_memory', 0))}
+                self.stage_totals[name] = (runs + 1, seconds + record['seconds'], memory, total_counters)
+                total = {'stage': name, 'seconds': seconds + record['seconds'], 'runs': runs + 1, **memory}
+                self._rates(total, total_counters)
+                self.stages[name] = total
+            self._emit('stage', record)
+
+    def task(self, name: str, seconds: float, files: int, bytes_written: int, peak_memory: Optional[int] = None):
+        record = {'task': name, 'seconds': seconds}
+        if peak_memory is not None:
+            record['peak_memory'] = peak_memory
+        self._rates(record, {'files_written': files, 'bytes_written': bytes_written})
+        with self.lock:
+            self.tasks.append(record)
+        self._emit('task', record)
+
+    def report(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'stages': dict(self.stages), 'counters': dict(self.counters), 'tasks': list(self.tasks),
+                'peak_rss': peak_rss(),
+            }
+
+    def save(self, report_path: str):
+        with open(report_path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.stage_totals = {}
+            self.tasks = []
+            self.counters = {}
+
+
+# the metrics of the pipeline in this process
+metrics = Metrics()
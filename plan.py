@@ -0,0 +1,68 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from datapack import PathTable
+from writer import SPLITS
+
+
+class SplitPlan(object):
+    """
+    SplitPlan is the complete assignment of the images to the tasks, kept
+    as columnar entries like DataPack, each entry is an image of a person
+    assigned to a split of the task (camera, batch), split is the position
+    in SPLITS and image is the index of the image path in paths. The entries
+    are grouped by task in the order the tasks are saved, and an image could
+    be assigned to several tasks and splits.
+    """
+
+    def __init__(
+            self, cameras: np.ndarray, batches: np.ndarray, splits: np.ndarray, persons: np.ndarray,
+            images: np.ndarray, paths: PathTable, seed: int, inputs: Optional[Dict[str, Any]] = None
+    ):
+        self.cameras = cameras
+        self.batches = batches
+        self.splits = splits
+        self.persons = persons
+        self.images = images
+        self.paths = paths
+        self.seed = seed
+        # the fingerprint of the datapack the plan was made from
+        self.inputs = inputs if inputs is not None else {}
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    def task_rows(self) -> Iterator[Tuple[int, int, slice]]:
+        """
+        :return: iterator of (cam_id, batch_id, rows) of the non-empty tasks.
+        """
+        if not len(self):
+            return
+        bounds = np.flatnonzero((self.cameras[1:] != self.cameras[:-1]) | (self.batches[1:] != self.batches[:-1]))
+        bounds = np.concatenate([[0], bounds + 1, [len(self)]]).tolist()
+        for begin, end in zip(bounds[:-1], bounds[1:]):
+            yield int(self.cameras[begin]), int(self.batches[begin]), slice(begin, end)
+
+    def records(self, rows: slice = slice(None)) -> Iterator[Tuple[int, int, str, int, str]]:
+        """
+        :return: iterator of (cam_id, batch_id, split, person_id, img_path)
+            of the entries in rows, the paths are resolved lazily.
+        """
+        for cam_id, batch_id, split, person_id, image in zip(
+                self.cameras[rows].tolist(), self.batches[rows].tolist(), self.splits[rows].tolist(),
+                self.persons[rows].tolist(), self.images[rows].tolist()
+        ):
+            yield cam_id, batch_id, SPLITS[split], person_id, self.paths[image]
+
+    def task_imgs(self, rows: slice) -> Dict[Tuple[str, int], List[str]]:
+        """
+        :return: the images of a task as given to ImageWriter.save_task,
+            { (split, person_id): [img_path] }.
+        """
+        task_imgs = {}
+        for split, person_id, image in zip(
+                self.splits[rows].tolist(), self.persons[rows].tolist(), self.images[rows].tolist()
+        ):
+            task_imgs.setdefault((SPLITS[split], person_id), []).append(self.paths[image])
+        return task_imgs
@@ -0,0 +1,211 @@
+import csv
+import mmap
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from writer import SPLITS
+
+
+class BlobReader(object):
+    """
+    Read the images of one task written by writer.BlobWriter, the blob is
+    memory mapped and each image is returned as a zero-copy memoryview,
+    which should be released before the reader is closed.
+    """
+
+    def __init__(self, task_path: str):
+        task_path = os.path.splitext(task_path)[0]
+        with np.load(f'{task_path}.npz') as index:
+            self.offsets = index['offset']
+            self.lengths = index['length']
+            self.labels = index['label']
+            self.splits = index['split']
+            self.names = index['name']
+
+        self.file = open(f'{task_path}.bin', 'rb')
+        if os.fstat(self.file.fileno()).st_size:
+            self.blob = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # an empty file could not be memory mapped
+            self.blob = b''
+        self.view = memoryview(self.blob)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, idx: int) -> memoryview:
+        offset = self.offsets[idx]
+        return self.view[offset:offset + self.lengths[idx]]
+
+    def split_indices(self, split: str) -> np.ndarray:
+        return np.flatnonzero(self.splits == SPLITS.index(split))
+
+    def close(self):
+        self.view.release()
+        if isinstance(self.blob, mmap.mmap):
+            self.blob.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class LRUCache(object):
+    """
+    Thread safe LRU cache of the loaded images bounded by max_bytes, the
+    size of a value is its nbytes if it is an array or its len otherwise.
+    The cache could be shared by the loaders of several tasks and rounds.
+    """
+
+    def __init__(self, max_bytes: int = 2 ** 30):
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()  # { Key: (Value, size) }
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def sizeof(value: Any) -> int:
+        return value.nbytes if hasattr(value, 'nbytes') else len(value)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.items.move_to_end(key)
+            return item[0]
+
+    def put(self, key: str, value: Any):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.items:
+                self.bytes -= self.items.pop(key)[1]
+            self.items[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self.items.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'count': len(self.items), 'bytes': self.bytes,
+            }
+
+
+class TaskLoader(object):
+    """
+    Load the images of one task written by writer.TreeWriter, StoreWriter
+    or ManifestWriter, task_path is the task directory or the manifest csv.
+    The images are listed once, read ahead by a thread pool and kept in an
+    LRU cache, so the repeated rounds over a task are served from memory.
+    :param cache: cache shared with the other loaders, a cache of max_bytes
+        is made if it is not given.
+    :param transform: function applied to the bytes of an image before it
+        is cached, e.g. a decoder, the loaders sharing a cache should share
+        the transform.
+    :param prefetch: image count read ahead of the iteration.
+    """
+
+    def __init__(
+            self, task_path: str, cache: Optional[LRUCache] = None, max_bytes: int = 2 ** 30, workers: int = 4,
+            transform: Optional[Callable[[bytes], Any]] = None, prefetch: int = 64
+    ):
+        if task_path.endswith('.csv'):
+            entries = self._list_manifest(task_path)
+        else:
+            entries = self._list_tree(task_path)
+        self.paths = [img_path for img_path, _, _ in entries]
+        self.labels = np.array([person_id for _, person_id, _ in entries], dtype=np.int64)
+        self.splits = np.array([SPLITS.index(split) for _, _, split in entries], dtype=np.int8)
+
+        self.cache = cache if cache is not None else LRUCache(max_bytes)
+        self.transform = transform
+        self.prefetch = prefetch
+        self.executor = ThreadPoolExecutor(workers)
+
+    @staticmethod
+    def _list_manifest(manifest_path: str):
+        with open(manifest_path, newline='') as f:
+            return [(row['path'], int(row['person']), row['split']) for row in csv.DictReader(f)]
+
+    @staticmethod
+    def _list_tree(task_dir: str):
+        # the links of a store task are resolved, so that an object shared
+        # by several tasks is cached once.
+        entries = []
+        for split in SPLITS:
+            split_dir = os.path.join(task_dir, split)
+            if not os.path.isdir(split_dir):
+                continue
+            for person_id in sorted(os.listdir(split_dir), key=int):
+                person_dir = os.path.join(split_dir, person_id)
+                entries.extend(
+                    (os.path.realpath(os.path.join(person_dir, name)), int(person_id), split)
+                    for name in sorted(os.listdir(person_dir))
+                )
+        return entries
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def _load(self, img_path: str) -> Any:
+        img = self.cache.get(img_path)
+        if img is None:
+            with open(img_path, 'rb') as f:
+                img = f.read()
+            if self.transform is not None:
+                img = self.transform(img)
+            self.cache.put(img_path, img)
+        return img
+
+    def __getitem__(self, idx: int) -> Any:
+        return self._load(self.paths[idx])
+
+    def split_indices(self, split: str) -> np.ndarray:
+        return np.flatnonzero(self.splits == SPLITS.index(split))
+
+    def iter_images(self, indices: Optional[Iterable[int]] = None) -> Iterator[Tuple[Any, int]]:
+        """
+        :return: iterator of (image, label) of the indices, all the images
+            by default, while the next prefetch images are read ahead.
+        """
+        indices = iter(range(len(self)) if indices is None else indices)
+        pending = deque()
+        for idx in indices:
+            pending.append((self.executor.submit(self._load, self.paths[idx]), int(self.labels[idx])))
+            if len(pending) > self.prefetch:
+                future, label = pending.popleft()
+                yield future.result(), label
+        while len(pending):
+            future, label = pending.popleft()
+            yield future.result(), label
+
+    def iter_split(self, split: str) -> Iterator[Tuple[Any, int]]:
+        return self.iter_images(self.split_indices(split))
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,90 @@
+import importlib
+from typing import Any, Dict, Iterator, Mapping, Optional
+
+# entry point groups third-party packages register their extractors and
+# output writers in, e.g. in pyproject.toml:
+# [project.entry-points."reid_datasets.extractors"]
+# mydataset = "mypackage.extractor:Extractor"
+EXTRACTOR_GROUP = 'reid_datasets.extractors'
+WRITER_GROUP = 'reid_datasets.writers'
+
+
+def _entry_points(group: str) -> Dict[str, Any]:
+    from importlib.metadata import entry_points
+
+    return {ep.name: ep for ep in entry_points(group=group)}
+
+
+class LazyRegistry(Mapping):
+    """
+    LazyRegistry maps each name to the object of its "module:attr" target,
+    the module is only imported when the name is first looked up, so the
+    names could be listed and checked without importing any of them.
+    The entry points of group are added after the built-in targets, which
+    they could not replace, and are only discovered when a name is not
+    built-in or all the names are listed.
+    """
+
+    def __init__(self, targets: Dict[str, str], group: Optional[str] = None):
+        self.targets = dict(targets)
+        self.group = group
+        self.entry_points = None
+        self.resolved = {}
+
+    def _discover(self):
+        if self.entry_points is None:
+            self.entry_points = {} if self.group is None else {
+                name: ep for name, ep in _entry_points(self.group).items() if name not in self.targets
+            }
+
+    def target(self, name: str) -> str:
+        """
+        :return: the "module:attr" target of name, without importing it.
+        """
+        if name in self.targets:
+            return self.targets[name]
+        self._discover()
+        if name not in self.entry_points:
+            raise KeyError(name)
+        return self.entry_points[name].value
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in self.resolved:
+            if name in self.targets:
+                module_name, attr = self.targets[name].split(':')
+                self.resolved[name] = getattr(importlib.import_module(module_name), attr)
+            else:
+                self._discover()
+                if name not in self.entry_points:
+                    raise KeyError(name)
+                self.resolved[name] = self.entry_points[name].load()
+        return self.resolved[name]
+
+    def __contains__(self, name: object) -> bool:
+        if name in self.targets:
+            return True
+        self._discover()
+        return name in self.entry_points
+
+    def __iter__(self) -> Iterator[str]:
+        self._discover()
+        yield from self.targets
+        yield from self.entry_points
+
+    def __len__(self) -> int:
+        self._discover()
+        return len(self.targets) + len(self.entry_points)
+
+
+MATERIALIZE_MODES = ('copy', 'hardlink', 'symlink', 'reflink')
+
+STORE_KEYS = ('path', 'content')
+
+output_writer = LazyRegistry({
+    "tree": "writer:TreeWriter",
+    "store": "writer:StoreWriter",
+    "manifest": "writer:ManifestWriter",
+    "shard": "writer:ShardWriter",
+    "blob": "writer:BlobWriter",
+    "array": "writer:ArrayWriter",
+}, group=WRITER_GROUP)
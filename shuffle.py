@@ -1,13 +1,19 @@
-import os
-import random
-import shutil
+import heapq
+import time
 from math import ceil, floor
-from typing import Tuple, List
+from typing import Tuple, Dict, List, Iterator, Optional, Sequence
 
 import numpy as np
 from tqdm import tqdm
 
 from datapack import DataPack
+from metrics import metrics
+from plan import SplitPlan
+from registry import output_writer
+from writer import SPLITS, ImageWriter, Journal
+
+# the stages drawing random numbers, each stage draws from its own streams
+RNG_STAGES = {'relabel': 0, 'sample': 1, 'split': 2, 'gallery': 3}
 
 
 class Shuffle(object):
@@ -16,7 +22,11 @@ class Shuffle(object):
             self,
             split_indice: Tuple[float, float, float] = (0.8, 0.1, 0.7),
             task_indice: Tuple[int, int] = (5, 8),
-            temporal_indice: Tuple[int, int] = (0.5, 3.0)
+            temporal_indice: Tuple[int, int] = (0.5, 3.0),
+            workers: int = 1,
+            materialize: str = 'copy',
+            output_format: str = 'tree',
+            **kwargs
     ):
         """
         Shuffle the Datapack images to fcl tasks
@@ -30,80 +40,150 @@ class Shuffle(object):
         :param task_indice: tuple with 2 elements as following
             (0) client count;
             (1) task count each client have.
+        :param workers: worker count used to copy images of each task
+            concurrently, 1 means copy images serially.
+        :param materialize: how the images are placed in the output, one of
+            copy, hardlink, symlink and reflink. links fall back to copy if
+            they are not supported, e.g. across filesystems.
+        :param output_format: how the tasks are written, a name of
+            registry.output_writer:
+            'tree' copies the images into task directories;
+            'store' keeps each image once in an object store linked by the
+            task directories;
+            'manifest' only writes the split of each task as csv without
+            copying any image;
+            'shard' packs each task split into tar shards;
+            'blob' concatenates the images of each task into one binary blob;
+            'array' decodes the images of each task split into a numpy array;
+            or the name of a writer installed by entry points.
+        :param kwargs: other arguments of the output writer, e.g. shard_size,
+            store, store_key and image_size.
         """
         self.split_indice = split_indice
         self.task_indice = task_indice
         self.temporal_indice = temporal_indice
+        self.workers = workers
+        self.materialize = materialize
+        self.output_format = output_format
+        self.writer_kwargs = kwargs
 
     @staticmethod
-    def _relabel_person_id(datapack: DataPack):
-        id_lut = list(range(datapack.current_person + 1))
-        random.shuffle(id_lut)
-        _pack = {}
-        for cam_id, protos in datapack.pack.items():
-            _pack[cam_id] = {}
-            for person_id, imgs in protos.items():
-                _pack[cam_id][id_lut[person_id]] = imgs
-        datapack.pack = _pack
+    def _rng(seed: int, stage: str, *keys: int) -> np.random.Generator:
+        """
+        the random stream of a stage, e.g. of a camera with keys (cam_id,) or
+        of a task with keys (cam_id, batch_id), which only depends on the
+        seed and the keys, so that each stream could be drawn alone or in
+        parallel with the same result.
+        """
+        return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(RNG_STAGES[stage], *keys)))
 
     @staticmethod
-    def _adjust_camera_count(datapack: DataPack, camera_num: int):
+    def _relabel_person_id(datapack: DataPack, seed: int = 123):
+        id_lut = Shuffle._rng(seed, 'relabel').permutation(datapack.current_person + 1)
+        datapack.relabel_persons(id_lut.tolist())
 
-        while len(datapack.pack) != camera_num:
+    @staticmethod
+    def _bitset(person_ids: np.ndarray) -> int:
+        if not len(person_ids):
+            return 0
+        mask = np.zeros(person_ids.max() + 1, dtype=bool)
+        mask[person_ids] = True
+        return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
 
-            # if the number of camera datapack is more than that of edge node,
-            # then merge the last 2 camera datapack into 1 camera datapack.
-            if len(datapack.pack) > camera_num:
-                sorted_pack = sorted(
-                    [(cam, len(person)) for cam, person in datapack.pack.items()],
-                    key=lambda t: t[1]
-                )
-                min_cam_id = sorted_pack[0][0]
-                min_cam_persons = datapack.pack[min_cam_id].keys()
-                most_diff_cam_id = sorted_pack[1][0]
-                most_diff_cam_persons = datapack.pack[most_diff_cam_id].keys()
-                for cam_id, _ in sorted_pack:
-                    curr_cam_persons = datapack.pack[cam_id].keys()
-                    if len(min_cam_persons - curr_cam_persons) > len(min_cam_persons - most_diff_cam_persons):
-                        most_diff_cam_id = cam_id
-                        most_diff_cam_persons = curr_cam_persons
-
-                # merge two camera id
-                for person_id, img_list in datapack.pack[min_cam_id].items():
-                    if person_id not in datapack.pack[most_diff_cam_id].keys():
-                        datapack.pack[most_diff_cam_id][person_id] = []
-                    datapack.pack[most_diff_cam_id][person_id].extend(img_list)
-
-                # remove one camera datapack.
-                del datapack.pack[min_cam_id]
-
-            # if the number of camera datapack is less than that of edge node,
-            # then split the biggest camera datapack into 2 camera datapack.
-            else:
-                max_cam_id, max_len = max(
-                    [(cam, len(person)) for cam, person in datapack.pack.items()],
-                    key=lambda t: t[1]
+    @staticmethod
+    def _plan_camera_count(datapack: DataPack, camera_num: int) -> Dict[int, Dict[int, List[int]]]:
+        """
+        Plan the whole sequence of camera merges or splits that makes the
+        camera count of datapack equal to camera_num.
+        :return: the cameras after adjusting in order, like
+            { Camera: { Person: [Source Camera] } }
+            where the source cameras of a person are in the order that its
+            images are merged.
+        """
+        plan = {cam: {person_id: [cam] for person_id in datapack.camera_persons(cam).tolist()}
+                for cam in datapack.camera_seq}
+        cam_pos = {cam: pos for pos, cam in enumerate(plan.keys())}
+
+        # if the number of camera datapack is more than that of edge node,
+        # then merge the camera with the least persons into the camera that
+        # shares the least persons with it, the persons of each camera are
+        # kept as bitsets to count the persons not shared.
+        if len(plan) > camera_num:
+            cam_bits = {cam: Shuffle._bitset(datapack.camera_persons(cam)) for cam in plan.keys()}
+            queue = [(len(person_seq), cam_pos[cam], cam) for cam, person_seq in plan.items()]
+            heapq.heapify(queue)
+            while len(plan) > camera_num:
+                min_len, _, min_cam_id = heapq.heappop(queue)
+                if min_cam_id not in plan or min_len != len(plan[min_cam_id]):
+                    continue
+
+                # choose the first camera by (person count, order) among the
+                # ones with the most persons not shared with min camera.
+                min_cam_bits = cam_bits[min_cam_id]
+                most_diff_cam_id = min(
+                    (cam for cam in plan.keys() if cam != min_cam_id),
+                    key=lambda cam: (
+                        -(min_cam_bits & ~cam_bits[cam]).bit_count(), len(plan[cam]), cam_pos[cam]
+                    )
                 )
-                new_cam_id = datapack.register_camera()
 
-                # copy the top half person ids from biggest camera datapack to
+                # merge two camera id and remove one camera datapack.
+                most_diff_person_seq = plan[most_diff_cam_id]
+                for person_id, source_cams in plan.pop(min_cam_id).items():
+                    most_diff_person_seq.setdefault(person_id, []).extend(source_cams)
+                cam_bits[most_diff_cam_id] |= cam_bits.pop(min_cam_id)
+                heapq.heappush(queue, (len(most_diff_person_seq), cam_pos[most_diff_cam_id], most_diff_cam_id))
+
+        # if the number of camera datapack is less than that of edge node,
+        # then split the first camera with the most persons into 2 camera
+        # datapack.
+        elif len(plan) < camera_num:
+            new_cam_id = datapack.current_camera
+            queue = [(-len(person_seq), cam_pos[cam], cam) for cam, person_seq in plan.items()]
+            heapq.heapify(queue)
+            while len(plan) < camera_num:
+                _, _, max_cam_id = heapq.heappop(queue)
+                max_person_seq = plan[max_cam_id]
+
+                # move the top half person ids from biggest camera datapack to
                 # the new camera pack.
-                trans_num = 0
-                for person_id, img_list in datapack.pack[max_cam_id].items():
-                    datapack.pack[new_cam_id][person_id] = img_list
-                    if (trans_num := trans_num + 1) >= max_len / 2:
-                        break
+                new_cam_id += 1
+                trans_person_ids = list(max_person_seq.keys())[:ceil(len(max_person_seq) / 2)]
+                plan[new_cam_id] = {person_id: max_person_seq.pop(person_id) for person_id in trans_person_ids}
+                cam_pos[new_cam_id] = len(cam_pos)
+                heapq.heappush(queue, (-len(max_person_seq), cam_pos[max_cam_id], max_cam_id))
+                heapq.heappush(queue, (-len(plan[new_cam_id]), cam_pos[new_cam_id], new_cam_id))
+
+        return plan
 
-                # remove the transferred person ids from old camera datapack.
-                for person_id, img_list in datapack.pack[new_cam_id].items():
-                    del datapack.pack[max_cam_id][person_id]
+    @staticmethod
+    def _adjust_camera_count(datapack: DataPack, camera_num: int):
+        # plan all the merges and splits first, then regroup the datapack once
+        datapack.regroup(Shuffle._plan_camera_count(datapack, camera_num))
 
         # rebase the camera id
-        _datapack = {}
-        for idx, (camera_id, person_seq) in enumerate(datapack.pack.items(), 0):
-            _datapack[idx] = dict(sorted(person_seq.items(), key=lambda ite: ite[0]))
-        datapack.pack = dict(sorted(_datapack.items(), key=lambda ite: ite[0]))
-        datapack.current_camera = len(_datapack.keys()) - 1
+        datapack.rebase_cameras()
+
+    @staticmethod
+    def _sample_swap_pairs(
+            rng: np.random.Generator, size: int, min_distance: float, max_distance: float, swap_cnt: int
+    ) -> np.ndarray:
+        """
+        Sample swap_cnt pairs (x, y) in [0, size) with min_distance <= x - y
+        <= max_distance, uniformly from all the admissible pairs, without
+        rejection. There are (size - d) pairs with the distance d, so the
+        distance is drawn in proportion to it and then y is drawn uniformly
+        from [0, size - d).
+        :return: array of pairs with shape (swap_cnt, 2), which is empty if
+            no pair is admissible.
+        """
+        distances = np.arange(max(ceil(min_distance), 0), min(floor(max_distance), size - 1) + 1)
+        if swap_cnt <= 0 or not len(distances):
+            return np.empty((0, 2), dtype=np.int64)
+        weights = size - distances
+        distance = rng.choice(distances, size=swap_cnt, p=weights / weights.sum())
+        y = rng.integers(0, size - distance)
+        return np.stack([y + distance, y], axis=1)
 
     @staticmethod
     def _sample_person_seq(
@@ -111,30 +191,31 @@ class Shuffle(object):
             task_cnt: int,
             temporal_ratio: float = 0.5,
             temporal_distance: float = 3.0,
+            seed: int = 123,
     ):
-        for cam_id, person_seq in datapack.pack.items():
-            task_size = floor(len(person_seq) / task_cnt)
-            person_ids = np.array(list(person_seq.keys()))
+        for cam_id in datapack.camera_seq:
+            rng = Shuffle._rng(seed, 'sample', cam_id)
+            person_ids = datapack.camera_persons(cam_id)
+            person_num = len(person_ids)
+            task_size = floor(person_num / task_cnt)
 
             # random replace two person id from different tasks
-            for swap_cnt in range(int(temporal_ratio * task_size)):
-                x = y = 0
-                while not 1.0 * task_size <= x - y <= temporal_distance * task_size:
-                    x = np.random.randint(0, len(person_seq))
-                    y = np.random.randint(0, len(person_seq))
+            swap_pairs = Shuffle._sample_swap_pairs(
+                rng, person_num, 1.0 * task_size, temporal_distance * task_size, int(temporal_ratio * task_size)
+            )
+            for x, y in swap_pairs:
                 person_ids[x], person_ids[y] = person_ids[y], person_ids[x]
 
             # random replace two different tasks
             task_resample_idx = np.arange(task_cnt)
-            for swap_cnt in range(int(temporal_ratio * task_cnt)):
-                x = y = 0
-                while not 1.0 <= x - y <= temporal_distance:
-                    x = np.random.randint(0, task_cnt)
-                    y = np.random.randint(0, task_cnt)
+            swap_pairs = Shuffle._sample_swap_pairs(
+                rng, task_cnt, 1.0, temporal_distance, int(temporal_ratio * task_cnt)
+            )
+            for x, y in swap_pairs:
                 task_resample_idx[x], task_resample_idx[y] = task_resample_idx[y], task_resample_idx[x]
 
             _person_ids = np.zeros_like(person_ids)
-            for task_id, source_pop_idx in enumerate(range(0, len(person_seq), task_size)):
+            for task_id, source_pop_idx in enumerate(range(0, person_num, task_size)):
                 if task_id < task_cnt:
                     target_pop_idx = task_resample_idx[task_id] * task_size
                     _person_ids[source_pop_idx:source_pop_idx + task_size] = \
@@ -144,13 +225,13 @@ class Shuffle(object):
             person_ids = _person_ids
 
             # sort person ids of each task
-            for pop_idx in range(0, len(person_seq), task_size):
+            for pop_idx in range(0, person_num, task_size):
                 person_ids[pop_idx:pop_idx + task_size] = sorted(person_ids[pop_idx:pop_idx + task_size])
 
             # plot histogram of person ids distribution
             # from matplotlib import pyplot as plt
             # plt.figure(figsize=(25, 3), dpi=300)
-            # for pop_idx in range(0, len(person_seq), task_size):
+            # for pop_idx in range(0, person_num, task_size):
             #     if pop_idx // task_size < task_cnt:
             #         datas = [person_ids[idx] for idx in range(pop_idx, pop_idx + task_size)]
             #         plt.subplot(1, task_cnt, 1 + pop_idx // task_size)
@@ -158,92 +239,224 @@ class Shuffle(object):
             # plt.show()
 
             # apply the changes in datapack
-            _person_seq = {person_id: person_seq[person_id] for person_id in person_ids}
-            datapack.pack[cam_id] = _person_seq
+            datapack.reorder_persons(cam_id, person_ids)
 
     @staticmethod
-    def save_imgs(img_path_list: List, save_dir: str):
-        if not os.path.exists(save_dir):
-            os.makedirs(save_dir)
-        for img_path in img_path_list:
-            save_path = os.path.join(save_dir, os.path.basename(img_path))
-            shutil.copyfile(img_path, save_path)
-
-    def shuffle_and_save(self, datapack: DataPack, output: str, seed: int = 123):
-        np.random.seed(seed)
-
+    def _group_rank(keys: np.ndarray, groups: np.ndarray, group_starts: np.ndarray) -> np.ndarray:
+        # rank of each row by its key among the rows of its group, the rows
+        # of a group are contiguous.
+        order = np.lexsort((keys, groups))
+        rank = np.empty(len(keys), dtype=np.int64)
+        rank[order] = np.arange(len(keys)) - group_starts[groups[order]]
+        return rank
+
+    def _plan_splits(
+            self, datapack: DataPack, seed: int, planned_cameras: Optional[Sequence[int]] = None
+    ) -> SplitPlan:
+        """
+        Assign the images of all the tasks to train, query and gallery at
+        once, the img_list of a person in a camera is a group of rows in the
+        datapack, and the split indice (0.8, 0.1, 0.7) for example means:
+        train  : random sample 80% from img_list;
+        query  : random sample 10% from img_list after the train images, the
+                 pivots are rounded outwards so query could share one image
+                 with train.
+        gallery: random sample 70% from img_list of the person in each other
+                 camera, the sample of a camera is the same for all the tasks.
+        the persons of each camera are divided equally into the tasks.
+        :param planned_cameras: only plan the tasks of these cameras, which
+            are the same as their tasks in the plan of all the cameras.
+        """
+        offsets = datapack.camera_offsets()
+        cameras, persons, images = datapack.cameras, datapack.persons, datapack.images
+        row_num = len(images)
+        task_cnt = self.task_indice[1]
+
+        is_first = np.ones(row_num, dtype=bool)
+        is_first[1:] = (persons[1:] != persons[:-1]) | (cameras[1:] != cameras[:-1])
+        group_starts = np.flatnonzero(is_first)
+        groups = np.cumsum(is_first) - 1
+        group_sizes = np.diff(np.append(group_starts, row_num))
+        group_cameras = cameras[group_starts]
+        group_persons = persons[group_starts]
+
+        # divide equally by person_id with each camera
+        camera_groups = np.searchsorted(group_starts, offsets)
+        person_nums = np.diff(camera_groups)
+        group_camera_ranks = np.repeat(np.arange(len(person_nums)), person_nums)
+        batch_sizes = np.maximum(np.ceil(person_nums / task_cnt).astype(np.int64), 1)
+        group_batches = np.minimum(
+            (np.arange(len(group_starts)) - camera_groups[group_camera_ranks]) // batch_sizes[group_camera_ranks],
+            task_cnt - 1
+        )
+
+        is_planned = np.ones(len(person_nums), dtype=bool) if planned_cameras is None \
+            else np.isin(datapack.camera_seq, planned_cameras)
+        planned_groups = np.flatnonzero(is_planned[group_camera_ranks])
+        is_planned_row = is_planned[group_camera_ranks[groups]]
+
+        # shuffle the img_list of each group, the keys of the rows of each
+        # task are drawn from the stream of the task, and the rows of a task
+        # are contiguous.
+        shuffle_keys = np.zeros(row_num)
+        task_bounds = np.searchsorted(
+            (group_camera_ranks * task_cnt + group_batches)[groups], np.arange(len(person_nums) * task_cnt + 1)
+        )
+        for rank, cam_id in enumerate(datapack.camera_seq):
+            if not is_planned[rank]:
+                continue
+            for batch_id in range(task_cnt):
+                rows = slice(task_bounds[rank * task_cnt + batch_id], task_bounds[rank * task_cnt + batch_id + 1])
+                shuffle_keys[rows] = self._rng(seed, 'split', cam_id, batch_id).random(rows.stop - rows.start)
+
+        # sample the gallery images of each group independently of the
+        # shuffle, from the stream of the camera, since the gallery sample of
+        # a camera is shared by the tasks of all the other cameras.
+        gallery_keys = np.empty(row_num)
+        for rank, cam_id in enumerate(datapack.camera_seq):
+            rows = slice(offsets[rank], offsets[rank + 1])
+            gallery_keys[rows] = self._rng(seed, 'gallery', cam_id).random(rows.stop - rows.start)
+
+        shuffle_rank = self._group_rank(shuffle_keys, groups, group_starts)
+        gallery_rank = self._group_rank(gallery_keys, groups, group_starts)
+        img_list_size = group_sizes[groups]
+        train_pivot = self.split_indice[0] * img_list_size
+        query_pivot = (self.split_indice[0] + self.split_indice[1]) * img_list_size
+        train_rows = np.flatnonzero((shuffle_rank < np.ceil(train_pivot)) & is_planned_row)
+        query_rows = np.flatnonzero(
+            (shuffle_rank >= np.floor(train_pivot)) & (shuffle_rank < np.ceil(query_pivot)) & is_planned_row
+        )
+        gallery_rows = np.flatnonzero(gallery_rank < (img_list_size * self.split_indice[2]).astype(np.int64))
+
+        # join the gallery images to the planned groups of the same person in
+        # the other cameras.
+        person_groups = planned_groups[np.argsort(group_persons[planned_groups], kind='stable')]
+        sorted_persons = group_persons[person_groups]
+        person_starts = np.searchsorted(sorted_persons, persons[gallery_rows])
+        person_cnts = np.searchsorted(sorted_persons, persons[gallery_rows], side='right') - person_starts
+        join_rows = np.repeat(gallery_rows, person_cnts)
+        join_groups = person_groups[
+            np.repeat(person_starts - np.cumsum(person_cnts) + person_cnts, person_cnts) + np.arange(len(join_rows))
+        ]
+        is_other = group_cameras[join_groups] != cameras[join_rows]
+        join_rows, join_groups = join_rows[is_other], join_groups[is_other]
+
+        # order the entries by task group, split, source camera and rank
+        entry_rows = np.concatenate([train_rows, query_rows, join_rows])
+        entry_groups = np.concatenate([groups[train_rows], groups[query_rows], join_groups])
+        entry_splits = np.repeat(np.arange(len(SPLITS), dtype=np.int8),
+                                 [len(train_rows), len(query_rows), len(join_rows)])
+        entry_sources = np.concatenate([
+            np.zeros(len(train_rows) + len(query_rows), dtype=np.int64), group_camera_ranks[groups[join_rows]]
+        ])
+        entry_ranks = np.concatenate([shuffle_rank[train_rows], shuffle_rank[query_rows], gallery_rank[join_rows]])
+        order = np.lexsort((entry_ranks, entry_sources, entry_splits, entry_groups))
+        entry_rows, entry_groups = entry_rows[order], entry_groups[order]
+
+        return SplitPlan(
+            cameras=group_cameras[entry_groups],
+            batches=group_batches[entry_groups],
+            splits=entry_splits[order],
+            persons=group_persons[entry_groups],
+            images=images[entry_rows],
+            paths=datapack.paths,
+            seed=seed,
+        )
+
+    def _shuffle(self, datapack: DataPack, seed: int):
         # relabel person ids
-        self._relabel_person_id(datapack)
+        with metrics.stage('relabel'):
+            self._relabel_person_id(datapack, seed)
 
         # adjust camera view count if the number of view is less than edge node
         if datapack.current_camera + 1 != self.task_indice[0]:
-            self._adjust_camera_count(datapack, self.task_indice[0])
-
-        # shuffle and save the dataset
-        self._sample_person_seq(datapack, self.task_indice[1], self.temporal_indice[0], self.temporal_indice[1])
-        for cam_id, person_seq in tqdm(datapack.pack.items(), desc="Saving"):
-            batch_id = -1
-            batch_size = ceil(len(person_seq) / self.task_indice[1])
-
-            empty_query = False
-            # divide equally by person_id with each camera
-            for idx, (person_id, img_list) in enumerate(person_seq.items()):
-
-                if idx % batch_size == 0 and batch_id + 1 < self.task_indice[1]:
-                    if empty_query:
-                        print("empty query for: camera {}, batch {}.".format(cam_id, batch_id))
-                    empty_query = True
-                    batch_id += 1
-
-                task_save_dir = os.path.join(output, f'task-{cam_id}-{batch_id}')
-                tr_save_dir = os.path.join(task_save_dir, 'train', f'{person_id}')
-                query_save_dir = os.path.join(task_save_dir, 'query', f'{person_id}')
-                gallery_save_dir = os.path.join(task_save_dir, 'gallery', f'{person_id}')
-
-                img_list_size = len(img_list)
-                np.random.shuffle(img_list)
-
-                # img_list is the total images from current person id and camera.
-                # and the train, query and gallery list has following roles:
-                # for example the split indice is (0.8, 0.1, 0.7)
-                # train  : random sample 80% from img_list;
-                # query  : random sample 10% from other cameras that is differ
-                #          from gallery and train cameras; if other camera not
-                #          exists, then random choice 10% from train img_list.
-                # gallery: contain the rest of img_list that has never been used
-                #          by train and query dataset, and the 70% image in train
-                #          dataset.
-
-                tr_img_list = []
-                query_img_list = []
-                gallery_img_list = []
-
-                split_pivot = self.split_indice[0] * img_list_size
-
-                # choose the images before split pivot as train images
-                tr_img_list.extend(img_list[:ceil(split_pivot)])
-
-                # choose the images between pre-split-pivot and new split_pivot
-                pre_split_pivot = split_pivot
-                split_pivot = (self.split_indice[0] + self.split_indice[1]) * img_list_size
-                query_img_list.extend(img_list[floor(pre_split_pivot):ceil(split_pivot)])
-
-                # choose gallery images from different cameras
-                for other_cam_id, other_person_seq in datapack.pack.items():
-                    if cam_id == other_cam_id:
-                        continue
-                    if person_id in other_person_seq.keys():
-                        np.random.seed(seed)
-                        gallery_img_list.extend(np.random.choice(
-                            other_person_seq[person_id],
-                            size=int(len(other_person_seq[person_id]) * self.split_indice[2]),
-                            replace=False
-                        ).tolist())
-
-                if len(tr_img_list):
-                    self.save_imgs(tr_img_list, tr_save_dir)
-                if len(query_img_list):
-                    empty_query = False
-                    self.save_imgs(query_img_list, query_save_dir)
-                if len(gallery_img_list):
-                    self.save_imgs(gallery_img_list, gallery_save_dir)
+            with metrics.stage('adjust'):
+                self._adjust_camera_count(datapack, self.task_indice[0])
+
+        with metrics.stage('sample'):
+            self._sample_person_seq(
+                datapack, self.task_indice[1], self.temporal_indice[0], self.temporal_indice[1], seed
+            )
+
+    def plan(self, datapack: DataPack, seed: int = 123, cameras: Optional[Sequence[int]] = None) -> SplitPlan:
+        """
+        Shuffle the datapack and plan the split of all the tasks without
+        writing anything, the plan could be saved by save_plan. All the
+        random decisions are drawn from the streams of seed, see _rng.
+        :param cameras: only plan the tasks of these cameras, e.g. to
+            regenerate the tasks of a camera alone or to plan the cameras in
+            parallel, which are the same as in the plan of all the cameras.
+        """
+        inputs = datapack.fingerprint()
+        self._shuffle(datapack, seed)
+        with metrics.stage('plan'):
+            plan = self._plan_splits(datapack, seed, cameras)
+        plan.inputs = inputs
+        return plan
+
+    def iter_tasks(self, datapack: DataPack, seed: int = 123) -> Iterator[Tuple[int, int, str, int, str]]:
+        """
+        Shuffle the datapack and yield the tasks lazily instead of saving
+        them, one task after another in the order they are saved. The
+        tasks are planned one camera at a time, so only the plan of a camera
+        is kept instead of the plan of all the tasks, see plan, and the
+        planning of each camera is recorded as the stage 'plan.{cam_id}'.
+        :return: iterator of (cam_id, batch_id, split, person_id, img_path),
+            where img_path is the path in the original dataset.
+        """
+        self._shuffle(datapack, seed)
+        for cam_id in list(datapack.camera_seq):
+            with metrics.stage(f'plan.{cam_id}'):
+                plan = self._plan_splits(datapack, seed, [cam_id])
+            for _, _, rows in plan.task_rows():
+                yield from plan.records(rows)
+
+    def shuffle_and_save(self, datapack: DataPack, output: str, seed: int = 123, resume: bool = False):
+        """
+        :param resume: skip the tasks finished by an interrupted run of the
+            same config and seed in output, and the images already saved.
+        """
+        self.save_plan(self.plan(datapack, seed), output, resume)
+
+    def save_plan(self, plan: SplitPlan, output: str, resume: bool = False):
+        # a run is only resumed from the same datasets and roots
+        config = {
+            **plan.inputs,
+            'seed': plan.seed,
+            'split_indice': list(self.split_indice),
+            'task_indice': list(self.task_indice),
+            'temporal_indice': list(self.temporal_indice),
+            'output_format': self.output_format,
+        }
+        # the writer is made first, so that the journal of output is kept
+        # if it could not be made
+        writer = output_writer[self.output_format](
+            output, workers=self.workers, materialize=self.materialize, resume=resume, **self.writer_kwargs
+        )
+        try:
+            journal = Journal(output, config, resume)
+        except BaseException:
+            writer.close()
+            raise
+        try:
+            with metrics.stage('save'):
+                self._save_plan(plan, writer, journal)
+        finally:
+            writer.close()
+            journal.close()
+
+    @staticmethod
+    def _save_plan(plan: SplitPlan, writer: ImageWriter, journal: Journal):
+        for cam_id, batch_id, rows in tqdm(list(plan.task_rows()), desc="Saving"):
+            if not np.any(plan.splits[rows] == SPLITS.index('query')):
+                print("empty query for: camera {}, batch {}.".format(cam_id, batch_id))
+            task_name = writer.task_name(cam_id, batch_id)
+            if not journal.is_finished(task_name):
+                start = time.perf_counter()
+                files_written, bytes_written = writer.files_written, writer.bytes_written
+                with metrics.peak_memory() as memory:
+                    writer.save_task(cam_id, batch_id, plan.task_imgs(rows))
+                journal.finish(task_name)
+                metrics.task(task_name, time.perf_counter() - start,
+                             writer.files_written - files_written, writer.bytes_written - bytes_written,
+                             memory.get('peak_memory'))
@@ -0,0 +1,123 @@
+import itertools
+import json
+import multiprocessing
+import os
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional
+
+from datapack import DataPack
+from extractor import extract
+from main import check_args, get_parser
+from metrics import metrics
+from shuffle import Shuffle
+
+SWEEP_KEYS = ('random_seed', 'split_indice', 'task_indice', 'temporal_indice')
+
+# the extracted datapack of a sweep worker process
+_datapack: Optional[DataPack] = None
+
+
+def expand_grid(grid: Dict[str, List[Any]], base: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    expand the grid { argument: [value] } to the configs of all the
+    combinations, the arguments not in grid are taken from base.
+    :return: { variant name: config } in grid order
+    """
+    for key in grid.keys():
+        if key not in SWEEP_KEYS:
+            raise ValueError(f"Could not sweep '{key}', the argument should be one of {SWEEP_KEYS}.")
+    variants = {}
+    for values in itertools.product(*grid.values()):
+        config = {key: base[key] for key in SWEEP_KEYS}
+        config.update(zip(grid.keys(), values))
+        name = '_'.join(
+            f"{key}-{'-'.join(map(str, value)) if isinstance(value, list) else value}"
+            for key, value in zip(grid.keys(), values)
+        )
+        variants[name] = config
+    return variants
+
+
+def _init_worker(datapack: DataPack, trace_memory: bool = False):
+    global _datapack
+    _datapack = datapack
+    if trace_memory:
+        metrics.trace_memory()
+
+
+def _run_variant(shuffle: Shuffle, output: str, seed: int, resume: bool) -> Dict[str, Any]:
+    metrics.reset()
+    shuffle.shuffle_and_save(_datapack.copy(), output, seed, resume)
+    return metrics.report()
+
+
+def sweep(
+        datapack: DataPack, output: str, variants: Dict[str, Dict[str, Any]], processes: int = 1,
+        resume: bool = False, **kwargs
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Shuffle and save every variant from one extracted datapack, each variant
+    is written to output/{variant name}.
+    :return: the metrics report of each variant, { variant name: report }
+    :param processes: variant count generated concurrently, the worker
+        processes share the datapack copy-on-write where fork is available.
+    :param kwargs: other arguments of Shuffle, e.g. workers and output_format.
+    """
+    os.makedirs(output, exist_ok=True)
+    with open(os.path.join(output, 'sweep.json'), 'w') as f:
+        json.dump(variants, f, indent=2)
+
+    jobs = [(
+        Shuffle(config['split_indice'], config['task_indice'], config['temporal_indice'], **kwargs),
+        os.path.join(output, name), config['random_seed'], resume
+    ) for name, config in variants.items()]
+
+    if processes <= 1:
+        _init_worker(datapack)
+        reports = [_run_variant(*job) for job in jobs]
+    else:
+        mp_context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(processes, mp_context=mp_context, initializer=_init_worker,
+                                 initargs=(datapack, tracemalloc.is_tracing())) as executor:
+            reports = list(executor.map(_run_variant, *zip(*jobs)))
+    return dict(zip(variants.keys(), reports))
+
+
+def main():
+    parser = get_parser()
+    parser.add_argument('--grid', type=str, required=True,
+                        help='json file or string of the swept arguments, like {"random_seed": [0, 1]}')
+    parser.add_argument('--processes', type=int, required=False, default=1, help='variant count run concurrently')
+    args = vars(parser.parse_args())
+    check_args(parser, args)
+
+    grid = args['grid']
+    if os.path.exists(grid):
+        with open(grid) as f:
+            grid = f.read()
+    variants = expand_grid(json.loads(grid), args)
+
+    # the variants share one object store
+    store = args['store']
+    if store is None and args['output_format'] == 'store':
+        store = os.path.join(args['output'], 'objects')
+
+    if args['report'] is not None:
+        metrics.trace_memory()
+    datapack = extract(args['datasets'], args['roots'], scan_cache=args['scan_cache'])
+    extract_report = metrics.report()
+    reports = sweep(
+        datapack, args['output'], variants, args['processes'], args['resume'],
+        workers=args['workers'], materialize=args['materialize'], output_format=args['output_format'],
+        shard_size=args['shard_size'] * 2 ** 20, store=store, store_key=args['store_key'],
+        image_size=args['image_size']
+    )
+
+    if args['report'] is not None:
+        with open(args['report'], 'w') as f:
+            json.dump({'extract': extract_report, 'variants': reports}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import os
+import sys
+from typing import Dict
+
+import pytest
+
+# the modules of the project are flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datapack import DataPack  # noqa: E402
+
+
+def build_datapack(layout: Dict[int, Dict[int, int]], root: str = 'data') -> DataPack:
+    """
+    build a datapack of fake image paths, layout should like:
+    { Camera: { Person: image count } }
+    the cameras and persons are registered in the order of layout.
+    """
+    datapack = DataPack()
+    for camera_id in layout.keys():
+        while datapack.current_camera < camera_id:
+            datapack.register_camera()
+    for person_seq in layout.values():
+        for person_id in person_seq.keys():
+            while datapack.current_person < person_id:
+                datapack.register_person()
+    for camera_id, person_seq in layout.items():
+        for person_id, img_cnt in person_seq.items():
+            datapack.add_image_path(person_id, camera_id, [
+                f'{root}/c{camera_id}/{person_id:04d}_{img_idx:02d}.jpg' for img_idx in range(img_cnt)
+            ])
+    return datapack
+
+
+def write_images(layout: Dict[int, Dict[int, int]], root: str):
+    """
+    write the fake images of build_datapack(layout, root), the content of
+    each image is its path repeated, so the images differ in content and size.
+    """
+    for camera_id, person_seq in layout.items():
+        os.makedirs(os.path.join(root, f'c{camera_id}'), exist_ok=True)
+        for person_id, img_cnt in person_seq.items():
+            for img_idx in range(img_cnt):
+                img_path = f'{root}/c{camera_id}/{person_id:04d}_{img_idx:02d}.jpg'
+                with open(img_path, 'wb') as f:
+                    f.write(img_path.encode() * (img_idx + 1))
+
+
+@pytest.fixture
+def datapack_layout() -> Dict[int, Dict[int, int]]:
+    return {
+        0: {0: 5, 1: 3, 2: 10, 4: 1},
+        1: {1: 4, 2: 2, 3: 7},
+        2: {0: 6, 3: 1, 4: 8, 5: 2},
+    }
@@ -0,0 +1,93 @@
+from conftest import build_datapack
+
+
+def resolved_pack(datapack):
+    # { Camera: { Person: [path] } }
+    return {
+        camera_id: {person_id: [datapack.paths[image] for image in images] for person_id, images in person_seq.items()}
+        for camera_id, person_seq in datapack.pack.items()
+    }
+
+
+def test_add_images_matches_add_image_path(datapack_layout):
+    expected = build_datapack(datapack_layout)
+    datapack = build_datapack({camera_id: {} for camera_id in datapack_layout})
+    person_ids, camera_ids, dirs = [], [], []
+    for camera_id, person_seq in datapack_layout.items():
+        names = []
+        for person_id, img_cnt in person_seq.items():
+            names.extend(f'{person_id:04d}_{img_idx:02d}.jpg' for img_idx in range(img_cnt))
+            person_ids.extend([person_id] * img_cnt)
+            camera_ids.extend([camera_id] * img_cnt)
+        dirs.append((f'data/c{camera_id}', names))
+    datapack.register_persons(expected.current_person + 1)
+    datapack.add_dir_images(person_ids, camera_ids, dirs)
+
+    assert datapack.img_cnt == expected.img_cnt
+    assert resolved_pack(datapack) == resolved_pack(expected)
+
+
+def test_merge_offsets_ids(datapack_layout):
+    other_layout = {0: {0: 2, 1: 1}, 1: {1: 3}}
+    datapack = build_datapack(datapack_layout, root='a')
+    other = build_datapack(other_layout, root='b')
+    expected = resolved_pack(datapack)
+    camera_offset, person_offset = datapack.current_camera + 1, datapack.current_person + 1
+    for camera_id, person_seq in resolved_pack(other).items():
+        expected[camera_id + camera_offset] = {
+            person_id + person_offset: img_list for person_id, img_list in person_seq.items()
+        }
+
+    datapack.merge(other)
+    assert resolved_pack(datapack) == expected
+    assert datapack.camera_seq == list(expected.keys())
+    assert datapack.img_cnt == sum(
+        len(img_list) for person_seq in expected.values() for img_list in person_seq.values()
+    )
+    assert datapack.current_camera == camera_offset + other.current_camera
+    assert datapack.current_person == person_offset + other.current_person
+
+
+def test_regroup_follows_plan(datapack_layout):
+    datapack = build_datapack(datapack_layout)
+    pack = resolved_pack(datapack)
+    # merge camera 1 into camera 2 and split persons 2 and 4 of camera 0 out
+    plan = {
+        2: {3: [1, 2], 0: [2], 4: [2], 5: [2], 1: [1], 2: [1]},
+        0: {0: [0], 1: [0]},
+        3: {2: [0], 4: [0]},
+    }
+    datapack.regroup(plan)
+
+    expected = {
+        camera_id: {
+            person_id: [path for source_cam in source_cams for path in pack[source_cam][person_id]]
+            for person_id, source_cams in person_seq.items()
+        }
+        for camera_id, person_seq in plan.items()
+    }
+    regrouped = resolved_pack(datapack)
+    assert regrouped == expected
+    assert list(regrouped.keys()) == list(plan.keys())
+    for camera_id, person_seq in plan.items():
+        assert list(regrouped[camera_id].keys()) == list(person_seq.keys())
+
+
+def test_rebase_cameras_sorts_persons(datapack_layout):
+    datapack = build_datapack(datapack_layout)
+    datapack.regroup({
+        2: {4: [2], 0: [2], 3: [2, 1], 5: [2]},
+        0: {2: [0, 1], 0: [0], 1: [0, 1], 4: [0]},
+    })
+    datapack.rebase_cameras()
+    assert datapack.camera_seq == [0, 1]
+    assert {camera_id: list(person_seq.keys()) for camera_id, person_seq in datapack.pack.items()} == {
+        0: [0, 3, 4, 5], 1: [0, 1, 2, 4]
+    }
+
+
+def test_copy_is_independent(datapack_layout):
+    datapack = build_datapack(datapack_layout)
+    copied = datapack.copy()
+    copied.relabel_persons(list(range(copied.current_person + 1))[::-1])
+    assert resolved_pack(datapack) == resolved_pack(build_datapack(datapack_layout))
@@ -0,0 +1,97 @@
+import os
+from collections import defaultdict
+
+import pytest
+
+from datapack import DataPack
+from extractor import dataset_name, extract
+from extractor.cache import ScanCache
+from metrics import metrics
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+
+
+@pytest.fixture
+def market_root(tmp_path):
+    names = {
+        'bounding_box_train': ['0002_c1s1_000451_03.jpg', '0002_c2s1_000551_01.jpg', '0007_c1s1_000101_01.jpg'],
+        'bounding_box_test': ['0000_c1s1_000151_01.jpg', '0007_c3s1_000376_03.jpg', 'Thumbs.db'],
+        'gt_bbox': ['0002_c1s1_001051_00.jpg'],
+        'query': ['0002_c1s1_001051_00.jpg', '0009_c3s1_000301_00.jpg'],
+    }
+    for dir_name, files in names.items():
+        for name in files:
+            touch(os.path.join(tmp_path, dir_name, name))
+    os.makedirs(os.path.join(tmp_path, 'query', '0001_c1s1_000001_00.jpg'))
+    return str(tmp_path)
+
+
+def labels(datapack):
+    # { path: (camera, person) }
+    return {
+        datapack.paths[image]: (camera_id, person_id)
+        for camera_id, person_seq in datapack.pack.items()
+        for person_id, images in person_seq.items() for image in images
+    }
+
+
+def test_market1501_spec(market_root):
+    datapack = DataPack()
+    dataset_name['market1501'](datapack, market_root).process()
+    image_labels = labels(datapack)
+
+    # the distractors of id 0, the other files and the directories are skipped
+    assert sorted(os.path.relpath(path, market_root) for path in image_labels) == sorted([
+        'bounding_box_train/0002_c1s1_000451_03.jpg', 'bounding_box_train/0002_c2s1_000551_01.jpg',
+        'bounding_box_train/0007_c1s1_000101_01.jpg', 'bounding_box_test/0007_c3s1_000376_03.jpg',
+        'gt_bbox/0002_c1s1_001051_00.jpg', 'query/0002_c1s1_001051_00.jpg', 'query/0009_c3s1_000301_00.jpg',
+    ])
+
+    # the same camera and id of file names give the same camera and person
+    camera_ids, person_ids = defaultdict(set), defaultdict(set)
+    for path, (camera_id, person_id) in image_labels.items():
+        name = os.path.basename(path)
+        camera_ids[name[6]].add(camera_id)
+        person_ids[name[:4]].add(person_id)
+    assert all(len(ids) == 1 for ids in camera_ids.values())
+    assert all(len(ids) == 1 for ids in person_ids.values())
+    assert datapack.current_camera + 1 == len(camera_ids) == 3
+    assert datapack.current_person + 1 == len(person_ids) == 3
+    assert datapack.img_cnt == 7
+
+
+def test_ethz_subdirs(tmp_path):
+    for seq, person in [('seq1', 'p001'), ('seq1', 'p002'), ('seq2', 'p001')]:
+        for frame in range(3):
+            touch(os.path.join(tmp_path, seq, person, f'frame{frame:04d}Person{person[-2:]}.png'))
+    os.makedirs(os.path.join(tmp_path, 'seq3'))
+
+    datapack = DataPack()
+    dataset_name['ethz'](datapack, str(tmp_path)).process()
+    image_labels = labels(datapack)
+    # a single camera, and a person of each directory of each sequence
+    assert {camera_id for camera_id, _ in image_labels.values()} == {0}
+    persons = defaultdict(set)
+    for path, (_, person_id) in image_labels.items():
+        persons[person_id].add(os.path.relpath(os.path.dirname(path), tmp_path))
+    assert sorted(len(dirs) for dirs in persons.values()) == [1, 1, 1]
+    assert datapack.img_cnt == 9
+
+
+def test_missing_root(tmp_path):
+    with pytest.raises(ValueError):
+        dataset_name['pku'](DataPack(), os.path.join(tmp_path, 'missing')).process()
+
+
+def test_scan_cache(market_root, tmp_path_factory):
+    cache_path = os.path.join(tmp_path_factory.mktemp('cache'), 'scan_cache.pkl')
+    first = extract(['market1501'], [market_root], scan_cache=cache_path)
+    metrics.reset()
+    second = extract(['market1501'], [market_root], scan_cache=cache_path)
+    assert metrics.counters.get('dirs_cached') == 4
+    assert 'files_scanned' not in metrics.counters
+    assert labels(second) == labels(first)
+    assert ScanCache(cache_path).entries
@@ -0,0 +1,60 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from metrics import Metrics
+
+
+@pytest.fixture
+def traced():
+    was_tracing = tracemalloc.is_tracing()
+    Metrics.trace_memory()
+    yield
+    if not was_tracing:
+        tracemalloc.stop()
+
+
+def test_stage_peak_memory_is_per_stage(traced):
+    metrics = Metrics()
+    with metrics.stage('large'):
+        np.ones(2 ** 22).sum()
+    with metrics.stage('small'):
+        np.ones(2 ** 10).sum()
+    assert metrics.stages['large']['peak_memory'] >= 2 ** 25
+    assert metrics.stages['small']['peak_memory'] < 2 ** 25
+
+
+def test_nested_peak_memory(traced):
+    metrics = Metrics()
+    with metrics.stage('outer'):
+        with metrics.peak_memory() as memory:
+            np.ones(2 ** 22).sum()
+        with metrics.peak_memory() as after:
+            pass
+    assert memory['peak_memory'] >= 2 ** 25
+    assert after['peak_memory'] < 2 ** 25
+    assert metrics.stages['outer']['peak_memory'] >= 2 ** 25
+
+
+def test_peak_memory_untraced():
+    if tracemalloc.is_tracing():
+        pytest.skip('memory is traced')
+    metrics = Metrics()
+    with metrics.stage('stage'):
+        pass
+    assert 'peak_memory' not in metrics.stages['stage']
+
+
+def test_repeated_stage_adds_up():
+    metrics = Metrics()
+    records = []
+    metrics.subscribe(lambda event, record: records.append(record))
+    for files in (3, 4):
+        with metrics.stage('extract.market1501'):
+            metrics.count('files_scanned', files)
+    record = metrics.stages['extract.market1501']
+    assert record['runs'] == 2
+    assert record['files_scanned'] == 7
+    assert record['seconds'] == pytest.approx(sum(run['seconds'] for run in records))
+    assert [run['files_scanned'] for run in records] == [3, 4]
@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import write_images
+from reader import BlobReader, LRUCache, TaskLoader
+from writer import BlobWriter, ManifestWriter, TreeWriter
+
+
+@pytest.fixture
+def task_imgs(tmp_path, datapack_layout):
+    # { (split, person_id): [img_path] } of the images of camera 0
+    root = str(tmp_path / 'data')
+    write_images(datapack_layout, root)
+    splits = ('train', 'query', 'gallery', 'train')
+    return {
+        (splits[person_id % 4], person_id): [
+            f'{root}/c0/{person_id:04d}_{img_idx:02d}.jpg' for img_idx in range(img_cnt)
+        ] for person_id, img_cnt in datapack_layout[0].items()
+    }
+
+
+def read_bytes(img_path):
+    with open(img_path, 'rb') as f:
+        return f.read()
+
+
+def test_blob_round_trip(tmp_path, task_imgs):
+    output = str(tmp_path / 'output')
+    writer = BlobWriter(output)
+    writer.save_task(0, 1, task_imgs)
+    writer.close()
+
+    expected = [
+        (split, person_id, img_path)
+        for (split, person_id), img_path_list in task_imgs.items() for img_path in img_path_list
+    ]
+    with BlobReader(os.path.join(output, 'task-0-1.bin')) as reader:
+        assert len(reader) == len(expected)
+        for idx, (split, person_id, img_path) in enumerate(expected):
+            img = reader[idx]
+            assert img.tobytes() == read_bytes(img_path)
+            img.release()
+            assert reader.labels[idx] == person_id
+            assert reader.names[idx] == os.path.basename(img_path)
+        for split in ('train', 'query', 'gallery'):
+            assert reader.split_indices(split).tolist() == [
+                idx for idx, (img_split, _, _) in enumerate(expected) if img_split == split
+            ]
+
+
+def test_blob_empty_task(tmp_path):
+    output = str(tmp_path / 'output')
+    BlobWriter(output).save_task(0, 0, {})
+    with BlobReader(os.path.join(output, 'task-0-0')) as reader:
+        assert len(reader) == 0
+        assert np.array_equal(reader.split_indices('train'), [])
+
+
+def test_lru_cache_evicts_least_recent():
+    cache = LRUCache(max_bytes=10)
+    cache.put('a', b'aaaa')
+    cache.put('b', b'bbbb')
+    assert cache.get('a') == b'aaaa'
+    cache.put('c', b'cccc')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'aaaa' and cache.get('c') == b'cccc'
+    cache.put('d', np.zeros(11, dtype=np.uint8))
+    assert cache.get('d') is None
+    assert cache.stats() == {'hits': 3, 'misses': 2, 'evictions': 1, 'count': 2, 'bytes': 8}
+
+
+@pytest.mark.parametrize('writer_class, task_name', [(TreeWriter, 'task-0-0'), (ManifestWriter, 'task-0-0.csv')])
+def test_task_loader(tmp_path, task_imgs, writer_class, task_name):
+    output = str(tmp_path / 'output')
+    writer = writer_class(output)
+    writer.save_task(0, 0, task_imgs)
+    writer.close()
+
+    expected = {}
+    for (split, person_id), img_path_list in task_imgs.items():
+        expected.setdefault(split, []).extend((read_bytes(img_path), person_id) for img_path in img_path_list)
+    expected = {split: sorted(imgs) for split, imgs in expected.items()}
+    cache = LRUCache()
+    for _ in range(2):
+        with TaskLoader(os.path.join(output, task_name), cache=cache, workers=2, prefetch=3) as loader:
+            assert len(loader) == sum(len(img_path_list) for img_path_list in task_imgs.values())
+            for split in ('train', 'query', 'gallery'):
+                assert sorted(loader.iter_split(split)) == expected.get(split, [])
+
+    # the second loader is served from the shared cache
+    stats = cache.stats()
+    assert stats['misses'] == stats['count'] == len(loader)
+    assert stats['hits'] == len(loader)
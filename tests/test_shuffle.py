@@ -0,0 +1,106 @@
+from collections import Counter
+from math import ceil, floor
+
+import numpy as np
+import pytest
+
+from conftest import build_datapack
+from metrics import metrics
+from shuffle import Shuffle
+from writer import SPLITS
+
+
+@pytest.mark.parametrize('size, min_distance, max_distance', [
+    (10, 1.0, 3.0), (10, 2.5, 7.5), (5, 0.0, 100.0), (50, 10.0, 10.0),
+])
+def test_sample_swap_pairs_in_band(size, min_distance, max_distance):
+    rng = np.random.default_rng(0)
+    pairs = Shuffle._sample_swap_pairs(rng, size, min_distance, max_distance, 200)
+    assert pairs.shape == (200, 2)
+    distances = pairs[:, 0] - pairs[:, 1]
+    assert np.all((pairs >= 0) & (pairs < size))
+    assert np.all((distances >= min_distance) & (distances <= max_distance))
+
+
+@pytest.mark.parametrize('size, min_distance, max_distance, swap_cnt', [
+    (10, 4.0, 3.0, 5), (3, 3.0, 5.0, 5), (1, 0.5, 1.0, 5), (10, 1.0, 3.0, 0),
+])
+def test_sample_swap_pairs_empty_band(size, min_distance, max_distance, swap_cnt):
+    rng = np.random.default_rng(0)
+    pairs = Shuffle._sample_swap_pairs(rng, size, min_distance, max_distance, swap_cnt)
+    assert pairs.shape == (0, 2)
+
+
+def test_plan_splits_counts(datapack_layout):
+    split_indice = (0.8, 0.1, 0.7)
+    shuffle = Shuffle(split_indice=split_indice, task_indice=(3, 2))
+    # the paths do not exist, the plan never touches the disk
+    plan = shuffle._plan_splits(build_datapack(datapack_layout), seed=7)
+
+    counts = Counter(zip(plan.cameras.tolist(), plan.persons.tolist(), plan.splits.tolist()))
+    for camera_id, person_seq in datapack_layout.items():
+        for person_id, img_cnt in person_seq.items():
+            assert counts[camera_id, person_id, SPLITS.index('train')] == ceil(split_indice[0] * img_cnt)
+            assert counts[camera_id, person_id, SPLITS.index('query')] == \
+                ceil((split_indice[0] + split_indice[1]) * img_cnt) - floor(split_indice[0] * img_cnt)
+            # the gallery of a person is sampled from the other cameras
+            assert counts[camera_id, person_id, SPLITS.index('gallery')] == sum(
+                int(other_seq[person_id] * split_indice[2]) for other_id, other_seq in datapack_layout.items()
+                if other_id != camera_id and person_id in other_seq
+            )
+    assert set(plan.splits.tolist()) <= set(range(len(SPLITS)))
+
+
+def test_plan_splits_tasks(datapack_layout):
+    shuffle = Shuffle(task_indice=(3, 2))
+    datapack = build_datapack(datapack_layout)
+    plan = shuffle._plan_splits(datapack, seed=7)
+
+    for camera_id, person_seq in datapack_layout.items():
+        person_ids = datapack.camera_persons(camera_id).tolist()
+        batch_size = ceil(len(person_ids) / 2)
+        for batch_id in range(2):
+            task_persons = set(person_ids[batch_id * batch_size:(batch_id + 1) * batch_size])
+            is_task = (plan.cameras == camera_id) & (plan.batches == batch_id)
+            assert set(plan.persons[is_task].tolist()) == task_persons
+
+    # the train and query images of a task are the images of its camera
+    for cam_id, batch_id, rows in plan.task_rows():
+        for (split, person_id), img_list in plan.task_imgs(rows).items():
+            if split != 'gallery':
+                assert all(img_path.startswith(f'data/c{cam_id}/{person_id:04d}_') for img_path in img_list)
+            else:
+                assert not any(img_path.startswith(f'data/c{cam_id}/') for img_path in img_list)
+
+
+def test_plan_splits_deterministic(datapack_layout):
+    shuffle = Shuffle(task_indice=(3, 2))
+    plans = [shuffle._plan_splits(build_datapack(datapack_layout), seed=seed) for seed in (7, 7, 8)]
+    assert np.array_equal(plans[0].images, plans[1].images)
+    assert np.array_equal(plans[0].splits, plans[1].splits)
+    assert not np.array_equal(plans[0].images, plans[2].images)
+
+
+@pytest.mark.parametrize('task_indice', [(3, 2), (2, 2), (4, 1)])
+def test_plan_cameras_alone(datapack_layout, task_indice):
+    shuffle = Shuffle(task_indice=task_indice)
+    plan = shuffle.plan(build_datapack(datapack_layout), seed=7)
+    for cam_id in range(task_indice[0]):
+        camera_plan = shuffle.plan(build_datapack(datapack_layout), seed=7, cameras=[cam_id])
+        is_camera = plan.cameras == cam_id
+        assert len(camera_plan) == int(is_camera.sum()) > 0
+        for column in ('cameras', 'batches', 'splits', 'persons', 'images'):
+            assert np.array_equal(getattr(camera_plan, column), getattr(plan, column)[is_camera])
+
+
+def test_iter_tasks_equals_plan(datapack_layout):
+    shuffle = Shuffle(task_indice=(3, 2))
+    plan = shuffle.plan(build_datapack(datapack_layout), seed=7)
+    records = list(shuffle.iter_tasks(build_datapack(datapack_layout), seed=7))
+    assert records == list(plan.records())
+
+
+def test_iter_tasks_plan_stages(datapack_layout):
+    metrics.reset()
+    list(Shuffle(task_indice=(3, 2)).iter_tasks(build_datapack(datapack_layout), seed=7))
+    assert {f'plan.{cam_id}' for cam_id in range(3)} <= set(metrics.stages)
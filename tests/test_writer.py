@@ -0,0 +1,176 @@
+import csv
+import json
+import os
+import tarfile
+
+import pytest
+
+from conftest import build_datapack, write_images
+from shuffle import Shuffle
+from writer import Journal, ShardWriter, StoreWriter, TreeWriter
+
+
+def read_tree(output):
+    # { relative path: content } of the files of output, except the journal
+    files = {}
+    for dir_path, _, names in os.walk(output):
+        for name in names:
+            path = os.path.join(dir_path, name)
+            if name != Journal.file_name:
+                with open(path, 'rb') as f:
+                    files[os.path.relpath(path, output)] = f.read()
+    return files
+
+
+@pytest.fixture
+def image_root(tmp_path, datapack_layout):
+    root = str(tmp_path / 'data')
+    write_images(datapack_layout, root)
+    return root
+
+
+def save(datapack_layout, root, output, resume=False):
+    shuffle = Shuffle(task_indice=(3, 2))
+    shuffle.save_plan(shuffle.plan(build_datapack(datapack_layout, root), seed=7), output, resume)
+
+
+@pytest.mark.parametrize('partial_line', ['{"task": "task-1', '{"task": "task-1\n', ''])
+def test_tree_writer_resume(tmp_path, monkeypatch, datapack_layout, image_root, partial_line):
+    expected_output, output = str(tmp_path / 'expected'), str(tmp_path / 'output')
+    save(datapack_layout, image_root, expected_output)
+
+    # interrupt the run after 2 tasks, and leave a partly written last line
+    save_task = TreeWriter.save_task
+    saved_tasks = []
+
+    def interrupted_save_task(writer, cam_id, batch_id, task_imgs):
+        if len(saved_tasks) == 2:
+            raise KeyboardInterrupt
+        save_task(writer, cam_id, batch_id, task_imgs)
+        saved_tasks.append(writer.task_name(cam_id, batch_id))
+
+    with monkeypatch.context() as patch:
+        patch.setattr(TreeWriter, 'save_task', interrupted_save_task)
+        with pytest.raises(KeyboardInterrupt):
+            save(datapack_layout, image_root, output)
+    journal_path = os.path.join(output, Journal.file_name)
+    with open(journal_path) as f:
+        assert [json.loads(line).get('task') for line in f][1:] == saved_tasks
+    with open(journal_path, 'a') as f:
+        f.write(partial_line)
+
+    save(datapack_layout, image_root, output, resume=True)
+    assert read_tree(output) == read_tree(expected_output)
+    with open(journal_path) as f:
+        records = [json.loads(line) for line in f]
+    with open(os.path.join(expected_output, Journal.file_name)) as f:
+        expected_records = [json.loads(line) for line in f]
+    assert records[0] == expected_records[0]
+    assert sorted(record['task'] for record in records[1:]) == sorted(
+        record['task'] for record in expected_records[1:]
+    )
+
+
+def test_journal_resume_other_config(tmp_path):
+    Journal(str(tmp_path), {'seed': 1}).close()
+    with pytest.raises(ValueError):
+        Journal(str(tmp_path), {'seed': 2}, resume=True)
+
+
+def test_save_plan_keeps_journal_if_writer_fails(tmp_path, datapack_layout, image_root):
+    output = str(tmp_path / 'output')
+    save(datapack_layout, image_root, output)
+    journal_path = os.path.join(output, Journal.file_name)
+    with open(journal_path) as f:
+        journal = f.read()
+
+    shuffle = Shuffle(task_indice=(3, 2), materialize='unknown')
+    with pytest.raises(ValueError):
+        shuffle.save_plan(shuffle.plan(build_datapack(datapack_layout, image_root), seed=8), output)
+    with open(journal_path) as f:
+        assert f.read() == journal
+
+
+@pytest.fixture
+def shard_imgs(tmp_path):
+    # { (split, person_id): [img_path] } of images of several sizes, with
+    # names long enough to need the gnu long name blocks
+    task_imgs = {}
+    for img_idx in range(40):
+        person_id = img_idx % 3
+        name = f'{img_idx:04d}_' + 'x' * (img_idx * 7 % 150) + '.jpg'
+        img_path = tmp_path / 'data' / name
+        img_path.parent.mkdir(exist_ok=True)
+        img_path.write_bytes(bytes([img_idx]) * (img_idx * 997 % 3000 + 1))
+        task_imgs.setdefault(('train' if img_idx % 4 else 'query', person_id), []).append(str(img_path))
+    big_path = tmp_path / 'data' / 'big.jpg'
+    big_path.write_bytes(b'b' * 20000)
+    task_imgs[('train', 5)] = [str(big_path)]
+    return task_imgs
+
+
+@pytest.mark.parametrize('shard_size', [10240, 16384, 2 ** 20])
+def test_shard_writer_offsets_and_sizes(tmp_path, shard_imgs, shard_size):
+    output = str(tmp_path / 'output')
+    writer = ShardWriter(output, shard_size=shard_size)
+    writer.save_task(0, 0, shard_imgs)
+    writer.close()
+
+    task_dir = os.path.join(output, writer.task_name(0, 0))
+    expected = {
+        (split, f'{person_id}/{os.path.basename(img_path)}'): img_path
+        for (split, person_id), img_path_list in shard_imgs.items() for img_path in img_path_list
+    }
+    saved = {}
+    for index_name in sorted(name for name in os.listdir(task_dir) if name.endswith('.csv')):
+        shard_path = os.path.join(task_dir, index_name[:-len('.csv')] + '.tar')
+        with open(os.path.join(task_dir, index_name), newline='') as f:
+            rows = list(csv.DictReader(f))
+        with open(shard_path, 'rb') as f:
+            shard_bytes = f.read()
+        with tarfile.open(shard_path) as shard:
+            assert shard.getnames() == [row['name'] for row in rows]
+
+        # a shard is only over shard_size if it holds a single image
+        assert len(shard_bytes) <= shard_size or len(rows) == 1
+        for row in rows:
+            offset, size = int(row['offset']), int(row['size'])
+            saved[(index_name.split('-')[0], row['name'])] = shard_bytes[offset:offset + size]
+    assert saved.keys() == expected.keys()
+    for key, img_path in expected.items():
+        with open(img_path, 'rb') as f:
+            assert saved[key] == f.read()
+
+
+@pytest.mark.parametrize('store_key', ['path', 'content'])
+def test_store_writer_shares_objects(tmp_path, store_key):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    for name, content in (('a.jpg', b'a'), ('b.jpg', b'bb'), ('c.jpg', b'a')):
+        (data_dir / name).write_bytes(content)
+    task_imgs = {
+        ('train', 0): [str(data_dir / 'a.jpg'), str(data_dir / 'b.jpg')],
+        ('gallery', 1): [str(data_dir / 'c.jpg')],
+    }
+    store = str(tmp_path / 'objects')
+
+    writers = [StoreWriter(str(tmp_path / name), store=store, store_key=store_key) for name in ('v0', 'v1')]
+    for writer in writers:
+        writer.save_task(0, 0, task_imgs)
+        writer.close()
+
+    # the tasks of both outputs link into the store with the image content
+    for writer in writers:
+        for (split, person_id), img_path_list in task_imgs.items():
+            for img_path in img_path_list:
+                save_path = os.path.join(writer.output, 'task-0-0', split, f'{person_id}', os.path.basename(img_path))
+                assert os.path.islink(save_path)
+                assert os.path.realpath(save_path).startswith(os.path.realpath(store))
+                with open(save_path, 'rb') as f, open(img_path, 'rb') as img:
+                    assert f.read() == img.read()
+
+    # the images are stored once, and identical contents once by content
+    objects = [name for _, _, names in os.walk(store) for name in names]
+    assert len(objects) == (2 if store_key == 'content' else 3)
+    assert writers[1].bytes_written == 0
+    assert writers[1].files_written == 3
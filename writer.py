@@ -0,0 +1,515 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from math import ceil
+from typing import Dict, List, Tuple, Any, Callable, Iterable, Optional
+
+import numpy as np
+
+from metrics import metrics
+from registry import MATERIALIZE_MODES, STORE_KEYS
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+SPLITS = ('train', 'query', 'gallery')
+
+# ioctl request of linux to share the data blocks between two files
+FICLONE = 0x40049409
+
+
+def materialize_img(img_path: str, save_path: str, materialize: str = 'copy') -> int:
+    """
+    :return: bytes copied, which is 0 if the image is linked.
+    """
+    # an existing save_path may be a link of an earlier run, which would be
+    # written through to the source image
+    if os.path.lexists(save_path):
+        os.remove(save_path)
+    if materialize != 'copy':
+        try:
+            if materialize == 'hardlink':
+                os.link(img_path, save_path)
+                return 0
+            if materialize == 'symlink':
+                os.symlink(os.path.abspath(img_path), save_path)
+                return 0
+            if materialize == 'reflink' and fcntl is not None:
+                with open(img_path, 'rb') as src, open(save_path, 'wb') as dst:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return 0
+        except OSError:
+            if os.path.lexists(save_path):
+                os.remove(save_path)
+    shutil.copyfile(img_path, save_path)
+    return os.path.getsize(save_path)
+
+
+def decode_img(img_path: str, image_size: Tuple[int, int]) -> np.ndarray:
+    """
+    decode the image as RGB and resize it to image_size (height, width).
+    :return: uint8 array with shape (height, width, 3)
+    """
+    with Image.open(img_path) as img:
+        img = img.convert('RGB').resize((image_size[1], image_size[0]), Image.BILINEAR)
+        return np.asarray(img, dtype=np.uint8)
+
+
+class ImageWriter(object):
+    """
+    Write the shuffled tasks to the output, task_imgs given to save_task
+    should like:
+    { (split, person_id): [img_path] }
+    where split is one of 'train', 'query' and 'gallery'.
+    """
+
+    def __init__(self, output: str, **kwargs):
+        self.output = output
+        self.files_written = 0
+        self.bytes_written = 0
+
+    def _written(self, files: int, bytes_written: int):
+        self.files_written += files
+        self.bytes_written += bytes_written
+        metrics.count('files_written', files)
+        metrics.count('bytes_written', bytes_written)
+
+    def _written_files(self, *file_paths: str):
+        self._written(len(file_paths), sum(os.path.getsize(file_path) for file_path in file_paths))
+
+    @staticmethod
+    def task_name(cam_id: int, batch_id: int) -> str:
+        return f'task-{cam_id}-{batch_id}'
+
+    def save_task(self, cam_id: int, batch_id: int, task_imgs: Dict[Tuple[str, int], List[str]]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class TreeWriter(ImageWriter):
+    """
+    output should like:
+    |-- task-0-0
+    |   |-- train
+    |   |   |-- 0
+    |   |   |   |-- 0002_c1s1_000451_03.jpg
+    |   |   |   |-- ...
+    |   |-- query
+    |   |-- gallery
+    |-- task-0-1
+    |-- ...
+    """
+
+    def __init__(
+            self, output: str, workers: int = 1, materialize: str = 'copy', resume: bool = False, **kwargs
+    ):
+        super(TreeWriter, self).__init__(output, **kwargs)
+        if materialize not in MATERIALIZE_MODES:
+            raise ValueError(f"Unknown materialize mode '{materialize}'.")
+        self.materialize = materialize
+        self.resume = resume
+        self.executor = ThreadPoolExecutor(workers) if workers > 1 else None
+
+    @staticmethod
+    def is_saved(img_path: str, save_path: str) -> bool:
+        # an image is saved if it has the size of source image and is not
+        # older than it, an interrupted copy leaves a shorter file.
+        try:
+            save_stat = os.stat(save_path)
+        except FileNotFoundError:
+            return False
+        img_stat = os.stat(img_path)
+        return save_stat.st_size == img_stat.st_size and save_stat.st_mtime >= img_stat.st_mtime
+
+    def _copy_jobs(self, cam_id: int, batch_id: int, task_imgs: Dict[Tuple[str, int], List[str]]) -> Dict[str, str]:
+        task_save_dir = os.path.join(self.output, self.task_name(cam_id, batch_id))
+
+        # create all the directories of the task at once, and the last image
+        # wins if several images share one save path.
+        copy_jobs = {}
+        for (split, person_id), img_path_list in task_imgs.items():
+            save_dir = os.path.join(task_save_dir, split, f'{person_id}')
+            os.makedirs(save_dir, exist_ok=True)
+            for img_path in img_path_list:
+                copy_jobs[os.path.join(save_dir, os.path.basename(img_path))] = img_path
+        return copy_jobs
+
+    def _map(self, fn: Callable, *iterables: Iterable) -> List:
+        if self.executor is None:
+            return list(map(fn, *iterables))
+        return list(self.executor.map(fn, *iterables))
+
+    def save_task(self, cam_id: int, batch_id: int, task_imgs: Dict[Tuple[str, int], List[str]]):
+        copy_jobs = self._copy_jobs(cam_id, batch_id, task_imgs)
+        if self.resume:
+            copy_jobs = {
+                save_path: img_path for save_path, img_path in copy_jobs.items()
+                if not self.is_saved(img_path, save_path)
+            }
+        sizes = self._map(partial(materialize_img, materialize=self.materialize), copy_jobs.values(), copy_jobs.keys())
+        self._written(len(copy_jobs), sum(sizes))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+class StoreWriter(TreeWriter):
+    """
+    Keep each image once in a content-addressed object store and write the
+    tasks as trees of relative symlinks into it, output should like:
+    |-- objects
+    |   |-- 3f
+    |   |   |-- 3f9a...c1.jpg
+    |   |-- ...
+    |-- task-0-0
+    |   |-- train
+    |   |   |-- 0
+    |   |   |   |-- 0002_c1s1_000451_03.jpg -> ../../../objects/3f/3f9a...c1.jpg
+    |-- ...
+    an object is keyed by the sha1 of the source path, size and mtime with
+    key 'path', or of the image content with key 'content', which also
+    shares identical images of different sources. The store could be shared
+    by several outputs, e.g. the variants of a sweep.
+    """
+
+    STORE_KEYS = STORE_KEYS
+
+    def __init__(self, output: str, store: Optional[str] = None, store_key: str = 'path', **kwargs):
+        super(StoreWriter, self).__init__(output, **kwargs)
+        if store_key not in self.STORE_KEYS:
+            raise ValueError(f"Unknown store key '{store_key}'.")
+        self.store = store if store is not None else os.path.join(output, 'objects')
+        self.store_key = store_key
+
+    def object_key(self, img_path: str) -> str:
+        if self.store_key == 'content':
+            digest = hashlib.sha1()
+            with open(img_path, 'rb') as f:
+                for chunk in iter(partial(f.read, 2 ** 20), b''):
+                    digest.update(chunk)
+        else:
+            img_stat = os.stat(img_path)
+            source = f'{os.path.abspath(img_path)}\0{img_stat.st_size}\0{img_stat.st_mtime_ns}'
+            digest = hashlib.sha1(os.fsencode(source))
+        return digest.hexdigest() + os.path.splitext(img_path)[1]
+
+    def put_object(self, img_path: str) -> Tuple[str, int]:
+        """
+        :return: the object path and the bytes copied, which is -1 if the
+            object is already stored.
+        """
+        key = self.object_key(img_path)
+        object_path = os.path.join(self.store, key[:2], key)
+        size = -1
+        if not os.path.exists(object_path):
+            # materialize to a temporary name first, so that an object is
+            # never seen half written by the other writers of the store.
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = f'{object_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            size = materialize_img(img_path, tmp_path, self.materialize)
+            os.replace(tmp_path, object_path)
+        return object_path, size
+
+    def save_task(self, cam_id: int, batch_id: int, task_imgs: Dict[Tuple[str, int], List[str]]):
+        copy_jobs = self._copy_jobs(cam_id, batch_id, task_imgs)
+        img_paths = list(dict.fromkeys(copy_jobs.values()))
+        objects = self._map(self.put_object, img_paths)
+        object_paths = {img_path: object_path for img_path, (object_path, _) in zip(img_paths, objects)}
+        for save_path, img_path in copy_jobs.items():
+            if os.path.lexists(save_path):
+                os.remove(save_path)
+            os.symlink(os.path.relpath(object_paths[img_path], os.path.dirname(save_path)), save_path)
+        # the links and the new objects are written
+        new_sizes = [size for _, size in objects if size >= 0]
+        self._written(len(copy_jobs) + len(new_sizes), sum(new_sizes))
+
+
+class ManifestWriter(ImageWriter):
+    """
+    Write the split of each task as a csv manifest instead of copying the
+    images, output should like:
+    |-- task-0-0.csv
+    |-- task-0-1.csv
+    |-- ...
+    and each row of the manifest is (path, person, camera, task, split).
+    """
+
+    header = ('path', 'person', 'camera', 'task', 'split')
+
+    def save_task(self, cam_id: int, batch_id: int, task_imgs: Dict[Tuple[str, int], List[str]]):
+        os.makedirs(self.output, exist_ok=True)
+        task_name = self.task_name(cam_id, batch_id)
+        manifest_path = os.path.join(self.output, f'{task_name}.csv')
+        with open(manifest_path, 'w', newline='') as f:
+            manifest = csv.writer(f)
+            manifest.writerow(self.header)
+            for (split, person_id), img_path_list in task_imgs.items():
+                manifest.writerows((img_path, person_id, cam_id, task_name, split) for img_path in img_path_list)
+        self._written_files(manifest_path)
+
+
+class ShardWriter(ImageWriter):
+    """
+    Pack each split of the tasks into tar shards of at most shard_size
+    bytes, unless a single image is larger, output should like:
+    |-- task-0-0
+    |   |-- train-00000.tar
+    |   |-- train-00000.csv
+    |   |-- train-00001.tar
+    |   |-- train-00001.csv
+    |   |-- query-00000.tar
+    |   |-- query-00000.csv
+    |   |-- gallery-00000.tar
+    |   |-- gallery-00000.csv
+    |-- task-0-1
+    |-- ...
+    the images are stored as '{person}/{image name}' members and the csv
+    sidecar gives (name, person, offset, size) of each member, so that an
+    image could be read from the shard by seeking to its offset directly.
+    """
+
+    header = ('name', 'person', 'offset', 'size')
+
+    def __init__(self, output: str, shard_size: int = 256 * 2 ** 20, **kwargs):
+        super(ShardWriter, self).__init__(output, **kwargs)
+        self.shard_size = shard_size
+
+    @staticmethod
+    def member_size(info: tarfile.TarInfo) -> int:
+        # the header blocks, including the long name blocks, and the padded data
+        header = info.tobuf(tarfile.GNU_FORMAT, tarfile.ENCODING, 'surrogateescape')
+        return len(header) + tarfile.BLOCKSIZE * ceil(info.size / tarfile.BLOCKSIZE)
+
+    @staticmethod
+    def closed_size(offset: int) -> int:
+        # the end of archive blocks are written on close, padded to records
+        return tarfile.RECORDSIZE * ceil((offset + 2 * tarfile.BLOCKSIZE) / tarfile.RECORDSIZE)
+
+    def save_task(self, cam_id: int, batch_id: int, task_imgs: Dict[Tuple[str, int], List[str]]):
+        task_save_dir = os.path.join(self.output, self.task_name(cam_id, batch_id))
+        os.makedirs(task_save_dir, exist_ok=True)
+
+        split_imgs = {}
+        for (split, person_id), img_path_list in task_imgs.items():
+            split_imgs.setdefault(split, []).extend((person_id, img_path) for img_path in img_path_list)
+
+        shard_names = []
+        for split, img_list in split_imgs.items():
+            shard_id = -1
+            shard, index, member_cnt = None, None, 0
+            try:
+                for person_id, img_path in img_list:
+                    arcname = f'{person_id}/{os.path.basename(img_path)}'
+                    if shard is not None:
+                        info = shard.gettarinfo(img_path, arcname=arcname)
+                    # a shard is only over shard_size if its first image is
+                    if shard is None or (
+                            member_cnt and self.closed_size(shard.offset + self.member_size(info)) > self.shard_size
+                    ):
+                        if shard is not None:
+                            shard.close()
+                            index.close()
+                        shard_id += 1
+                        shard_name = os.path.join(task_save_dir, f'{split}-{shard_id:05d}')
+                        shard_names.append(shard_name)
+                        shard = tarfile.open(f'{shard_name}.tar', 'w', format=tarfile.GNU_FORMAT)
+                        index = open(f'{shard_name}.csv', 'w', newline='')
+                        index_writer = csv.writer(index)
+                        index_writer.writerow(self.header)
+                        member_cnt = 0
+                        info = shard.gettarinfo(img_path, arcname=arcname)
+
+                    with open(img_path, 'rb') as f:
+                        shard.addfile(info, f)
+                    member_cnt += 1
+                    # the member data ends at the current offset, padded to blocks
+                    offset_data = shard.offset - tarfile.BLOCKSIZE * ceil(info.size / tarfile.BLOCKSIZE)
+                    index_writer.writerow((info.name, person_id, offset_data, info.size))
+            finally:
+                if shard is not None:
+                    shard.close()
+                    index.close()
+        self._written_files(*(f'{shard_name}.{ext}' for shard_name in shard_names for ext in ('tar', 'csv')))
+
+
+class BlobWriter(ImageWriter):
+    """
+    Concatenate the images of each task into one binary blob, output should
+    like:
+    |-- task-0-0.bin
+    |-- task-0-0.npz
+    |-- task-0-1.bin
+    |-- task-0-1.npz
+    |-- ...
+    the npz index holds the arrays 'offset', 'length', 'label', 'split' (the
+    position in SPLITS) and 'name' of each image, and could be read by
+    reader.BlobReader.
+    """
+
+    def save_task(self, cam_id: int, batch_id: int, task_imgs: Dict[Tuple[str, int], List[str]]):
+        os.makedirs(self.output, exist_ok=True)
+        task_name = os.path.join(self.output, self.task_name(cam_id, batch_id))
+
+        offsets, lengths, labels, splits, names = [], [], [], [], []
+        with open(f'{task_name}.bin', 'wb') as blob:
+            for (split, person_id), img_path_list in task_imgs.items():
+                for img_path in img_path_list:
+                    with open(img_path, 'rb') as f:
+                        offsets.append(blob.tell())
+                        lengths.append(blob.write(f.read()))
+                    labels.append(person_id)
+                    splits.append(SPLITS.index(split))
+                    names.append(os.path.basename(img_path))
+
+        np.savez(
+            f'{task_name}.npz',
+            offset=np.array(offsets, dtype=np.int64),
+            length=np.array(lengths, dtype=np.int64),
+            label=np.array(labels, dtype=np.int64),
+            split=np.array(splits, dtype=np.int8),
+            name=np.array(names, dtype=str),
+        )
+        self._written_files(f'{task_name}.bin', f'{task_name}.npz')
+
+
+class ArrayWriter(ImageWriter):
+    """
+    Decode and resize the images of each task split once into a uint8
+    array, output should like:
+    |-- task-0-0
+    |   |-- train.npy
+    |   |-- train_label.npy
+    |   |-- query.npy
+    |   |-- query_label.npy
+    |   |-- gallery.npy
+    |   |-- gallery_label.npy
+    |-- task-0-1
+    |-- ...
+    the image array has the shape (count, height, width, 3) and could be
+    loaded with np.load(mmap_mode='r'), the label array gives the person id
+    of each image. The images are decoded by Pillow in workers processes.
+    """
+
+    def __init__(self, output: str, image_size: Tuple[int, int] = (256, 128), workers: int = 1, **kwargs):
+        super(ArrayWriter, self).__init__(output, **kwargs)
+        if Image is None:
+            raise ImportError("Pillow is required by the array output format, install it by 'pip install Pillow'.")
+        self.image_size = tuple(image_size)
+        self.executor = ProcessPoolExecutor(workers) if workers > 1 else None
+
+    def save_task(self, cam_id: int, batch_id: int, task_imgs: Dict[Tuple[str, int], List[str]]):
+        task_save_dir = os.path.join(self.output, self.task_name(cam_id, batch_id))
+        os.makedirs(task_save_dir, exist_ok=True)
+
+        split_imgs = {}
+        for (split, person_id), img_path_list in task_imgs.items():
+            split_imgs.setdefault(split, []).extend((person_id, img_path) for img_path in img_path_list)
+
+        _decode_img = partial(decode_img, image_size=self.image_size)
+        for split, img_list in split_imgs.items():
+            labels, img_paths = zip(*img_list)
+            label_path = os.path.join(task_save_dir, f'{split}_label.npy')
+            np.save(label_path, np.array(labels, dtype=np.int64))
+
+            # fill the memory mapped array as the images are decoded, so that
+            # only the decoded chunks in flight are kept in memory.
+            imgs_path = os.path.join(task_save_dir, f'{split}.npy')
+            imgs = np.lib.format.open_memmap(
+                imgs_path, mode='w+', dtype=np.uint8, shape=(len(img_paths), *self.image_size, 3)
+            )
+            if self.executor is None:
+                decoded = map(_decode_img, img_paths)
+            else:
+                decoded = self.executor.map(_decode_img, img_paths, chunksize=64)
+            for idx, img in enumerate(decoded):
+                imgs[idx] = img
+            imgs.flush()
+            del imgs
+            self._written_files(label_path, imgs_path)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+class Journal(object):
+    """
+    Journal records the finished tasks of an output in a json lines file,
+    the first line is the config of the run, so that an interrupted run
+    could be resumed with the same config and skip the finished tasks.
+    """
+
+    file_name = '.journal'
+
+    def __init__(self, output: str, config: Dict[str, Any], resume: bool = False):
+        self.journal_path = os.path.join(output, self.file_name)
+        self.finished = set()
+        os.makedirs(output, exist_ok=True)
+
+        if resume and os.path.exists(self.journal_path):
+            records = self._read_records()
+            if len(records) and records[0] != config:
+                raise ValueError(f"Could not resume '{output}', its config {records[0]} differs from {config}.")
+            self.finished.update(record['task'] for record in records[1:])
+            self.journal = open(self.journal_path, 'a')
+            if not len(records):
+                self._record(config)
+        else:
+            self.journal = open(self.journal_path, 'w')
+            self._record(config)
+
+    def _read_records(self) -> List[Dict[str, Any]]:
+        """
+        :return: the records of the journal, the last line is dropped if it
+            is only partly written, e.g. when the disk was full, which is
+            truncated so that the next record starts on a line of its own.
+        """
+        with open(self.journal_path, 'rb') as f:
+            lines = f.readlines()
+        records, size = [], 0
+        for line_idx, line in enumerate(lines):
+            try:
+                if not line.endswith(b'\n'):
+                    raise ValueError('the line is not ended')
+                if line.strip():
+                    records.append(json.loads(line))
+            except ValueError:
+                if line_idx < len(lines) - 1:
+                    raise
+                with open(self.journal_path, 'r+b') as f:
+                    f.truncate(size)
+                break
+            size += len(line)
+        return records
+
+    def _record(self, record: Dict[str, Any]):
+        self.journal.write(json.dumps(record) + '\n')
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def is_finished(self, task_name: str) -> bool:
+        return task_name in self.finished
+
+    def finish(self, task_name: str):
+        self.finished.add(task_name)
+        self._record({'task': task_name})
+
+    def close(self):
+        self.journal.close()
+